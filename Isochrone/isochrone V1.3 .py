@@ -1,252 +1,351 @@
-import osmnx as ox
-import networkx as nx
-import matplotlib.pyplot as plt
-from shapely.geometry import Point, LineString, Polygon
-from shapely.ops import unary_union
-import geopandas as gpd
-import contextily as cx
 import numpy as np
 from tqdm import tqdm
-import pandas as pd
 import os
-import re
-from matplotlib_scalebar.scalebar import ScaleBar
+import sys
+import argparse
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pypinyin import lazy_pinyin
 
+# 复用 Isochrone_UI 中的路网模块
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Isochrone_UI'))
+from regional_graph import RegionalGraphProvider, boundary_reaches, fetch_radius
+from graph_cache import GraphCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE_MB
+from routing import group_origins, FAR_SNAP_DISTANCE, SNAP_MODES
+from cost_profiles import COST_PROFILES, ELEVATION_PROFILES, WALKING_SPEED, reach_factor
+from isochrone_pipeline import (IsochroneSettings, process_points, process_points_task, save_router,
+                                rerender_cached, VIEW_HALF_WIDTH)
+from map_renderer import RENDER_PROFILES
+from vector_export import BatchVectorSink, VECTOR_FORMATS, batch_vector_path
+from run_manifest import RunManifest, graph_version, pending_points
+from isochrone_polygon import POLYGON_METHODS
+from tile_cache import TileCache, BasemapMosaic, DEFAULT_TILE_DIR
+from coordinate_reader import read_coordinates
+
 """
 步行等时圈生成工具
 
-- 基于给定起始点计算1000米步行范围等时圈
+- 基于给定起始点计算1000米(或多个距离)步行范围等时圈
 - 考虑地理障碍物和实际步行路径
 - 输出为PNG格式地图
 """
 
-# 读取CSV文件中的起始点坐标
-print("正在读取起始点坐标数据...")
-try:
-    # 读取文件内容
-    with open('metrostation.CSV', 'r', encoding='utf-8') as file:
-        lines = file.readlines()
-    
-    # 解析数据
-    stations_data = []
-    for line in lines:
-        line = line.strip()
-        if not line:  # 跳过空行
-            continue
-            
-        # 使用正则表达式匹配站点名称和坐标
-        match = re.match(r'(.+?)\s*\((\d+\.\d+),\s*(\d+\.\d+)\)', line)
-        if match:
-            name = match.group(1).strip()
-            lng = float(match.group(2))
-            lat = float(match.group(3))
-            stations_data.append({
-                'name': name,
-                'longitude': lng,
-                'latitude': lat
-            })
-    
-    # 创建DataFrame
-    stations_df = pd.DataFrame(stations_data)
-    
+
+def parse_args():
+    """命令行参数"""
+    parser = argparse.ArgumentParser(description="步行等时圈生成工具")
+    parser.add_argument('--per-point', action='store_true',
+                        help="每个起始点单独下载路网(默认邻近点共享一个区域路网)")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="路网缓存目录")
+    parser.add_argument('--cache-size', type=float, default=DEFAULT_CACHE_SIZE_MB,
+                        help="路网缓存容量上限(MB)，设为0则不使用缓存")
+    parser.add_argument('--osm-snapshot', default=None,
+                        help="OSM数据快照标识，用于区分缓存(默认读取Overpass的date设置)")
+    parser.add_argument('--distances', type=int, nargs='+', default=[1000],
+                        help="步行距离(米)，可指定多个距离生成嵌套的等时圈环，如 --distances 500 1000 1500")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="并行进程数(默认1，即逐点处理)")
+    parser.add_argument('--method', choices=POLYGON_METHODS, default='buffer',
+                        help="等时圈多边形构建方法: buffer(缓冲合并，默认)、concave(凹包) 或 raster(栅格化)")
+    parser.add_argument('--raster-resolution', type=float, default=5,
+                        help="raster方法的网格分辨率(米，默认5)")
+    parser.add_argument('--tile-dir', default=DEFAULT_TILE_DIR, help="底图瓦片缓存目录")
+    parser.add_argument('--tile-url', default=None,
+                        help="底图瓦片URL模板，如 http://127.0.0.1:8000/{z}/{x}/{y}.png (默认OpenStreetMap)")
+    parser.add_argument('--offline', action='store_true', help="只使用本地缓存的底图瓦片，不联网下载")
+    parser.add_argument('--basemap-mosaic', action='store_true',
+                        help="为全部起始点一次性拼接整体底图，每个点只取其中的切片")
+    parser.add_argument('--render-profile', choices=list(RENDER_PROFILES), default='publication',
+                        help="绘图配置: publication(300dpi，默认) 或 preview(低分辨率快速预览，并保存几何供之后重绘)")
+    parser.add_argument('--vector-format', choices=list(VECTOR_FORMATS) + ['none'], default='gpkg',
+                        help="全部等时圈写入单个图层的格式: gpkg(默认)、parquet(需要pyarrow) 或 none")
+    parser.add_argument('--shapefiles', action='store_true', help="同时为每个起始点单独保存Shapefile")
+    parser.add_argument('--merge-tolerance', type=float, default=0,
+                        help="相距不超过该距离(米)的起始点合并计算(默认0，只合并定位到同一位置的点)")
+    parser.add_argument('--snap', choices=SNAP_MODES, default='edge',
+                        help="起始点定位方式: edge(最近的边上的投影点，默认) 或 node(最近的路网节点)")
+    parser.add_argument('--profile', choices=COST_PROFILES, default='distance',
+                        help="边成本配置: distance(路网长度，默认)、walking(按步速的步行时间)、elderly(老年人步速)、"
+                             "steps(台阶加罚)、hills(按DEM坡度的步行时间，需要--dem)；"
+                             "时间类配置下步行距离表示以标准步速步行该距离所需的时间")
+    parser.add_argument('--walking-speed', type=float, default=WALKING_SPEED,
+                        help=f"walking与hills配置的平路步速(km/h，默认{WALKING_SPEED})")
+    parser.add_argument('--dem', default=None,
+                        help="hills配置使用的本地DEM文件(GeoTIFF)，按坡度用Tobler徒步函数计算步行时间，需要rasterio")
+    parser.add_argument('--no-resume', action='store_true',
+                        help="重新计算全部起始点(默认跳过输出目录中已用相同参数完成的点)")
+    parser.add_argument('--rerender', action='store_true',
+                        help="用preview时保存的几何重绘出版质量的地图，不重新计算等时圈")
+    args = parser.parse_args()
+    if args.profile in ELEVATION_PROFILES and not args.dem:
+        parser.error(f"--profile {args.profile} requires --dem")
+    if args.profile in ELEVATION_PROFILES and not os.path.isfile(args.dem):
+        parser.error(f"DEM file not found: {args.dem}")
+    return args
+
+
+def read_stations():
+    """读取CSV文件中的起始点坐标"""
+    print("正在读取起始点坐标数据...")
+    try:
+        # 按块读取并向量化解析，格式(站点名称 (经度, 纬度)、分隔文本或带表头的表格)只判断一次
+        stations_df = read_coordinates('metrostation.CSV')
+
+        if stations_df.empty:
+            raise Exception("未找到有效的起始点坐标")
+
+        # 显示数据预览
+        print("\n数据预览:")
+        print(stations_df.head())
+        print(f"\n成功读取了 {len(stations_df)} 个起始点坐标")
+        return stations_df
+
+    except Exception as e:
+        print(f"读取坐标文件出错: {e}")
+        print("\n请确保坐标文件格式正确:")
+        print("1. 每行格式应为: 站点名称 (经度, 纬度)")
+        print("2. 例如: 团岛 (120.2945709, 36.057163)")
+        exit(1)
+
+
+def report_results(pending, progress, block, manifest, sink=None):
+    """
+    汇报进程池中已完成的任务(每个任务为共用同一起始节点的一组点)，
+    写入批量矢量图层并记录到断点清单，block为True时等待全部完成
+    """
+    done = as_completed(list(pending)) if block else [f for f in list(pending) if f.done()]
+    for future in done:
+        points = pending.pop(future)
+        progress.update(len(points))
+        try:
+            for point, (output_filename, isochrone_wgs84) in zip(points, future.result()):
+                if sink is not None:
+                    sink.add(isochrone_wgs84)
+                manifest.record(point, output_filename)
+                print(f"已保存地图到: {output_filename}")
+        except Exception as e:
+            # 单点出错不影响其他点
+            names = ', '.join(point['name'] for point in points)
+            print(f"处理起始点 {names} 时出错: {e}")
+
+
+def main():
+    args = parse_args()
+    output_dir = "等时圈结果"
+
+    # 等时圈参数：节点缓冲20米、边缓冲15米、简化公差20米，仅输出PNG
+    settings = IsochroneSettings(args.distances, output_dir, node_buffer=20, edge_buffer=15,
+                                 simplify_tolerance=20, write_shapefile=args.shapefiles,
+                                 png_suffix='Walking_Isochrone', origin_label='Origin Point',
+                                 method=args.method, raster_resolution=args.raster_resolution,
+                                 basemap=TileCache(args.tile_dir, args.tile_url, offline=args.offline),
+                                 render_profile=args.render_profile, snap=args.snap, profile=args.profile,
+                                 walking_speed=args.walking_speed, dem_path=args.dem,
+                                 merge_tolerance=args.merge_tolerance)
+
+    if args.rerender:
+        # 只重绘地图，不读取坐标、不计算等时圈
+        settings.render_profile = 'publication'
+        print("正在用缓存的几何重绘出版质量的地图...")
+        outputs = rerender_cached(settings, lambda message, percent: print(message))
+        print(f"\n共重绘 {len(outputs)} 张地图")
+        return
+
+    stations_df = read_stations()
+
+    # 创建输出目录
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+        print(f"创建输出目录: {output_dir}")
+
+    cache = GraphCache(args.cache_dir, args.cache_size, args.osm_snapshot) if args.cache_size > 0 else None
+
+    # 全部起始点的等时圈批量写入同一个矢量图层
+    sink = None
+    if args.vector_format != 'none':
+        sink = BatchVectorSink(batch_vector_path(output_dir, settings.distance_label, args.vector_format),
+                               args.vector_format)
+
+    # 断点续跑：跳过输出目录中已用相同输入完成的点，只计算新增或参数改变的点
+    snapshot = cache.snapshot if cache is not None else args.osm_snapshot
+    manifest = RunManifest(output_dir, settings, graph_version(snapshot=snapshot))
+    if not args.no_resume:
+        todo, skipped = pending_points(stations_df.to_dict('records'), manifest, sink)
+        if skipped:
+            stations_df = stations_df.iloc[todo].reset_index(drop=True)
+            print(f"跳过 {skipped} 个已完成的起始点")
     if stations_df.empty:
-        raise Exception("未找到有效的起始点坐标")
-    
-    # 显示数据预览
-    print("\n数据预览:")
-    print(stations_df.head())
-    print(f"\n成功读取了 {len(stations_df)} 个起始点坐标")
-    
-except Exception as e:
-    print(f"读取坐标文件出错: {e}")
-    print("\n请确保坐标文件格式正确:")
-    print("1. 每行格式应为: 站点名称 (经度, 纬度)")
-    print("2. 例如: 团岛 (120.2945709, 36.057163)")
-    exit(1)
-
-# 创建输出目录
-output_dir = "等时圈结果"
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
-    print(f"创建输出目录: {output_dir}")
-
-# 遍历每个起始点
-for index, row in tqdm(stations_df.iterrows(), total=len(stations_df), desc="处理起始点"):
-    lat = row['latitude']
-    lng = row['longitude']
-    station_name = row['name'] if 'name' in row else f"点位_{index+1}"
-
-    # 将站点名称转换为拼音
-    station_name_pinyin = ''.join(lazy_pinyin(station_name))
-
-    print(f"\n处理起始点: {station_name} (拼音: {station_name_pinyin}) (纬度: {lat}, 经度: {lng})")
+        if sink is not None:
+            sink.close()
+        print("\n所有起始点均已完成，无需重新计算")
+        return
+
+    # 将起始点划分为路网区域，区域内的点共享同一个路网；下载范围由最大步行距离加绕行余量确定
+    provider = RegionalGraphProvider(stations_df.to_dict('records'),
+                                     fetch_distance=fetch_radius(settings.distance,
+                                                                 reach_factor(args.profile, args.walking_speed)),
+                                     regional=not args.per_point, cache=cache)
+    print(f"共划分 {len(provider.regions)} 个路网区域")
+
+    # 临时文件目录：并行模式的区域路网、整体底图
+    work_dir = tempfile.mkdtemp(prefix='isochrone_')
+
+    # 并行模式：逐点的绘图与输出分发到进程池，区域路网数组写入临时目录，子进程以内存映射共用
+    executor = None
+    pending = {}
+    if args.workers > 1:
+        executor = ProcessPoolExecutor(max_workers=args.workers,
+                                       mp_context=multiprocessing.get_context('spawn'))
+        print(f"使用 {args.workers} 个进程并行处理")
+
+    progress = tqdm(total=len(stations_df), desc="处理起始点")
 
     try:
-        # 步骤1: 数据准备 - 获取路网数据
-        print("步骤1/4: 获取路网数据...")
-        with tqdm(total=100, desc="下载进度") as pbar:
-            # 获取4公里范围内的步行路网，确保涵盖足够区域
-            G = ox.graph_from_point((lat, lng), dist=4000, network_type='all')
-            pbar.update(100)
-
-        # 步骤2: 路网分析 - 投影和构建网络
-        print("步骤2/4: 构建步行路网...")
-        with tqdm(total=100, desc="处理进度") as pbar:
-            # 将地理坐标投影到平面坐标系统(UTM)以便进行距离计算
-            G_proj = ox.project_graph(G)
-            pbar.update(33)
-            
-            # 创建起始点并投影到相同坐标系
-            origin_point = Point(lng, lat)
-            origin_gdf = gpd.GeoDataFrame(geometry=[origin_point], crs="EPSG:4326")
-            origin_proj = origin_gdf.to_crs(G_proj.graph['crs'])
-            origin_x, origin_y = origin_proj.geometry.x[0], origin_proj.geometry.y[0]
-            
-            # 找到路网中距离起始点最近的节点
-            origin_node = ox.distance.nearest_nodes(G_proj, X=origin_x, Y=origin_y)
-            pbar.update(33)
-            
-            # 设置每条边的权重为长度(米)，用于后续计算
-            for u, v, data in G_proj.edges(data=True):
-                data['weight'] = data['length']
-            pbar.update(34)
-
-        # 步骤3: 等时圈计算 - 生成1000米步行范围
-        print("步骤3/4: 计算步行范围...")
-        with tqdm(total=100, desc="计算进度") as pbar:
-            # 计算从起始节点出发，在给定距离(1000米)内可达的子图
-            # 使用weight属性作为边权重，即长度
-            subgraph = nx.ego_graph(G_proj, origin_node, radius=1000, distance='weight')
-            pbar.update(25)
-            
-            # 提取子图中的节点和边
-            nodes, edges = ox.graph_to_gdfs(subgraph)
-            pbar.update(25)
-            
-            # 生成缓冲区和合并操作，创建等时圈轮廓
-            node_buffers = nodes.buffer(20)  # 增加节点缓冲区
-            
-            # 为边创建缓冲区
-            edge_lines = [LineString([Point(data.geometry.coords[0]), 
-                                     Point(data.geometry.coords[-1])]) 
-                         for _, data in edges.iterrows()]
-            edge_buffers = gpd.GeoSeries(edge_lines).buffer(15)  # 增加边缓冲区
-            pbar.update(25)
-            
-            # 合并所有缓冲区创建初始等时圈
-            buffers = list(node_buffers) + list(edge_buffers)
-            if buffers:
-                isochrone_polygon = unary_union(buffers)
-                
-                # 平滑处理
-                isochrone_polygon = isochrone_polygon.buffer(10).buffer(-5)
-                
-                # 应用Douglas-Peucker简化算法，公差为20米
-                isochrone_polygon = isochrone_polygon.simplify(20, preserve_topology=True)
-                
-                if hasattr(isochrone_polygon, 'geoms'):
-                    # 处理MultiPolygon情况：取面积最大的多边形
-                    largest_polygon = max(isochrone_polygon.geoms, key=lambda p: p.area)
-                    # 仅保留外部环，去除内部孔洞
-                    isochrone_polygon = Polygon(largest_polygon.exterior)
+        if args.basemap_mosaic:
+            # 一次性拼接覆盖全部起始点视图的整体底图，失败时退回逐点读取瓦片
+            print("正在拼接整体底图...")
+            try:
+                with tqdm(desc="底图瓦片") as pbar:
+                    def update(number, total):
+                        pbar.total = total
+                        pbar.update(1)
+                    settings.basemap = BasemapMosaic.build(settings.basemap, stations_df['latitude'],
+                                                           stations_df['longitude'], VIEW_HALF_WIDTH,
+                                                           os.path.join(work_dir, 'basemap.npy'),
+                                                           zoom=RENDER_PROFILES[args.render_profile]['zoom'],
+                                                           progress=update)
+            except Exception as e:
+                print(f"拼接整体底图出错，改为逐点读取瓦片: {e}")
+
+        # 遍历每个路网区域(到达路网边界而扩大范围的区域追加在列表末尾，随后处理)
+        for region_number, region in enumerate(provider.regions):
+            try:
+                # 步骤1: 数据准备 - 获取路网数据(每个区域只下载、投影一次)
+                print(f"\n步骤1/4: 获取路网数据 ({region})...")
+                with tqdm(total=100, desc="下载进度") as pbar:
+                    # 获取区域包络(按步行距离外扩)内的步行路网，确保涵盖足够区域
+                    # 区域路网以紧凑CSR数组的形式读取，供区域内所有点计算最短路径
+                    router, from_cache = provider.load_graph(region)
+                    pbar.update(100)
+                if from_cache:
+                    print("已从缓存读取路网")
+                print(f"路网: {router.n_nodes} 个节点, {len(router.edge_u)} 条边, {router.nbytes / 1024 / 1024:.1f} MB")
+
+                # 边成本按所选配置计算
+                router = router.with_profile(args.profile, args.walking_speed, args.dem)
+            except Exception as e:
+                print(f"获取路网数据出错 ({region}): {e}")
+                progress.update(len(region.indices))
+                continue
+
+            # 步骤2: 路网分析 - 批量定位区域内的所有起始点，定位到同一位置(或相距很近)的起始点归为一组
+            print(f"步骤2/4: 定位 {len(region.indices)} 个起始点...")
+            region_df = stations_df.iloc[region.indices]
+            try:
+                # 一次投影全部起始点，并在路网节点的KD树或边的STRtree上一次查询
+                origins, snap_dist, origin_x, origin_y = router.locate_origins(region_df['latitude'],
+                                                                               region_df['longitude'], args.snap)
+            except Exception as e:
+                print(f"定位起始点出错 ({region}): {e}")
+                progress.update(len(region.indices))
+                continue
+            for position in np.flatnonzero(snap_dist > FAR_SNAP_DISTANCE):
+                print(f"注意: {region_df['name'].iloc[position]} 距最近的路网{'边' if args.snap == 'edge' else '节点'} {snap_dist[position]:.0f} 米")
+            groups = group_origins(origins, origin_x, origin_y, settings.merge_tolerance)
+            if len(groups) < len(region.indices):
+                print(f"{len(region.indices)} 个起始点共定位到 {len(groups)} 个起始位置，每个只计算一次")
+
+            # 步骤3: 等时圈计算 - 一次计算区域内所有起点最大距离内的最短距离
+            print(f"步骤3/4: 计算 {len(groups)} 个起始点的步行范围...")
+            try:
+                distances = router.multi_source_distances([origins[group[0]] for group in groups], settings.distance)
+            except Exception as e:
+                print(f"计算步行范围出错 ({region}): {e}")
+                progress.update(len(region.indices))
+                continue
+            # 从批量结果中取出各起点最大距离内的可达节点及距离
+            reaches = [router.row_distances(distances, row) for row in range(len(groups))]
+            del distances
+
+            # 到达路网边界的起始点：扩大下载范围，随后作为新区域重新计算
+            truncated = boundary_reaches(region, router, reaches)
+            if truncated:
+                positions = np.concatenate([groups[i] for i in truncated])
+                expanded = provider.expand(region, positions)
+                if expanded is None:
+                    print(f"注意: {len(positions)} 个起始点的步行范围到达路网边界，等时圈可能不完整")
                 else:
-                    # 处理单个Polygon情况：直接去除内部孔洞
-                    isochrone_polygon = Polygon(isochrone_polygon.exterior)
-            else:
-                # 如果没有可达点，创建一个小范围圆形作为等时圈
-                isochrone_polygon = origin_proj.geometry[0].buffer(50)
-            pbar.update(25)
-
-            node_buffers.plot()
-            edge_buffers.plot()
-
-        # 步骤4: 可视化输出 - 生成地图并保存
-        print("步骤4/4: 生成地图输出...")
-        with tqdm(total=100, desc="可视化进度") as pbar:
-            # 创建等时圈GeoDataFrame
-            isochrone_gdf = gpd.GeoDataFrame(geometry=[isochrone_polygon])
-            isochrone_gdf.crs = G_proj.graph['crs']
-            
-            # 转换为Web Mercator (EPSG:3857)用于绘图
-            isochrone_web_mercator = isochrone_gdf.to_crs(epsg=3857)
-            edges_web_mercator = edges.to_crs(epsg=3857)
-            origin_web_mercator = origin_gdf.to_crs(epsg=3857)
-            pbar.update(20)
-            
-            # 创建图形和坐标轴
-            fig, ax = plt.subplots(1, 1, figsize=(10, 10))
-            
-            # 获取起始点坐标
-            center_x = origin_web_mercator.geometry.x[0]
-            center_y = origin_web_mercator.geometry.y[0]
-            
-            # 设置固定的视图范围 (4km x 4km)
-            half_width = 2000  # 2km半径，总共4km
-            ax.set_xlim([center_x - half_width, center_x + half_width])
-            ax.set_ylim([center_y - half_width, center_y + half_width])
-            pbar.update(20)
-            
-            # 添加底图 (OpenStreetMap) 并设置缩放等级
-            cx.add_basemap(ax, source=cx.providers.OpenStreetMap.Mapnik, zoom=16)
-            
-            # 绘制路网
-            edges_web_mercator.plot(ax=ax, linewidth=0.7, color='gray', alpha=0.6, zorder=2)
-            
-            # 绘制等时圈轮廓 - 蓝色(#0000FF)，宽度1px，无填充
-            isochrone_web_mercator.boundary.plot(
-                ax=ax, 
-                color='#0000FF',  # 蓝色
-                linewidth=1,      # 1像素宽度
-                zorder=3          # 确保在路网上方显示
-            )
-            
-            # 绘制起始点
-            origin_web_mercator.plot(
-                ax=ax, 
-                color='red', 
-                marker='*', 
-                markersize=100, 
-                zorder=4
-            )
-            pbar.update(20)
-            
-            # 添加比例尺
-            ax.add_artist(ScaleBar(
-                dx=1, 
-                location='lower right', 
-                box_alpha=0.5, 
-                color='black'
-            ))
-            
-            # 添加图例
-            legend_elements = [
-                plt.Line2D([0], [0], color='#0000FF', lw=1, label='1000m Walking Range'),
-                plt.Line2D([0], [0], color='gray', lw=0.7, alpha=0.6, label='Walking Network'),
-                plt.Line2D([0], [0], color='red', marker='*', lw=0, markersize=10, label='Origin Point')
-            ]
-            ax.legend(handles=legend_elements, loc='lower left', framealpha=0.5)
-            
-            # 移除坐标轴
-            ax.set_axis_off()
-            
-            # 添加标题
-            plt.title(f'{station_name_pinyin} - 1000m Walking Isochrone', fontsize=14)
-            plt.tight_layout()
-            
-            # 保存为PNG格式
-            output_filename = os.path.join(output_dir, f'{station_name_pinyin}_1000m_Walking_Isochrone.png')
-            plt.savefig(output_filename, dpi=300, bbox_inches='tight', format='png')
-            plt.close()
-            pbar.update(20)
-            
-            print(f"Saved map to: {output_filename}")
-            
-        print(f"已保存地图到: {output_filename}")
-        
-    except Exception as e:
-        print(f"处理起始点 {station_name} 时出错: {e}")
-        print(f"错误详情: {str(e)}")
-        continue
+                    print(f"{len(positions)} 个起始点的步行范围到达路网边界，扩大到 {expanded.fetch_distance:.0f} 米范围重新计算")
+                    keep = [i for i in range(len(groups)) if i not in set(truncated)]
+                    groups = [groups[i] for i in keep]
+                    reaches = [reaches[i] for i in keep]
+
+            if executor is not None:
+                router_path = save_router(router, os.path.join(work_dir, f'region_{region_number}'))
+
+            for group, (reach, reach_dist) in zip(groups, reaches):
+                points = []
+                for position in group:
+                    row = region_df.iloc[position]
+                    station_name = row['name'] if 'name' in row else f"点位_{region.indices[position]+1}"
+                    # 将站点名称转换为拼音
+                    points.append({
+                        'name': station_name,
+                        'name_pinyin': ''.join(lazy_pinyin(station_name)),
+                        'latitude': row['latitude'],
+                        'longitude': row['longitude'],
+                    })
+
+                if executor is not None:
+                    # 提交到进程池，结果在完成后汇报
+                    future = executor.submit(process_points_task, router_path, points, reach, reach_dist, settings)
+                    pending[future] = points
+                    continue
+
+                for point in points:
+                    print(f"\n处理起始点: {point['name']} (拼音: {point['name_pinyin']}) "
+                          f"(纬度: {point['latitude']}, 经度: {point['longitude']})")
+                progress.update(len(points))
+
+                try:
+                    # 步骤3-4: 生成等时圈轮廓(组内只生成一次)并为每个起始点输出地图
+                    print("步骤4/4: 生成地图输出...")
+                    results = process_points(router, points, reach, reach_dist, settings)
+                    for point, (output_filename, isochrone_wgs84) in zip(points, results):
+                        if sink is not None:
+                            sink.add(isochrone_wgs84)
+                        manifest.record(point, output_filename)
+                        print(f"已保存地图到: {output_filename}")
+                except Exception as e:
+                    names = ', '.join(point['name'] for point in points)
+                    print(f"处理起始点 {names} 时出错: {e}")
+                    print(f"错误详情: {str(e)}")
+                    continue
+
+            # 释放区域路网
+            del router, reaches
+
+            # 汇报已完成的并行任务
+            report_results(pending, progress, False, manifest, sink)
+
+        # 等待剩余的并行任务
+        report_results(pending, progress, True, manifest, sink)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if sink is not None:
+            sink.close()
+
+    progress.close()
+    if sink is not None and sink.rows_written:
+        print(f"已将 {sink.rows_written} 个等时圈保存到: {sink.path}")
+    if cache is not None:
+        print(f"路网缓存: 命中 {cache.hits} 次, 未命中 {cache.misses} 次")
+    print("\n所有起始点处理完成！")
+
 
-print("\n所有起始点处理完成！")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
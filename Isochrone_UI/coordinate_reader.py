@@ -0,0 +1,212 @@
+"""
+坐标文件读取模块
+
+- 每个文件只判断一次格式与列布局(带name/latitude/longitude表头的表格、三列 名称,经度,纬度、
+  名称 (经度, 纬度) 文本、Tab/逗号分隔文本)
+- 按块读取文件，每块以列式NumPy数组(名称、纬度、经度)返回，适合十万级的起始点
+- 文本行用预编译的正则表达式对整列做向量化提取，不逐行循环；安装了pyarrow时使用其正则引擎(RE2)
+- 文本行先用文件的主要格式提取，只有未匹配的行才尝试另一种格式
+- Excel无法按块读取，整表读入后同样按块输出
+"""
+import csv
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+# 每块读取的行数
+DEFAULT_CHUNK_ROWS = 50000
+
+# 判断列布局时读取的样本行数
+SAMPLE_ROWS = 50
+
+# 支持的文件类型
+SUPPORTED_EXTENSIONS = ('.csv', '.txt', '.xlsx', '.xls')
+
+# 标准表格的列名
+COLUMNS = ['name', 'latitude', 'longitude']
+
+# 文本格式: 名称 (经度, 纬度) 或类似变体
+TEXT_PATTERN = re.compile(r'^(?P<name>.+?)\s*[\(\[\{]?\s*(?P<longitude>\d+\.\d+)\s*,\s*(?P<latitude>\d+\.\d+)\s*[\)\]\}]?')
+
+# Tab或逗号分隔: 名称后第一对相邻的数值字段为经度、纬度
+_NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+DELIMITED_PATTERN = re.compile(r'^(?P<name>[^\t,]*)[\t,]+(?:[^\t,]*[\t,]+)*?\s*(?P<longitude>' + _NUMBER
+                               + r')\s*[\t,]+\s*(?P<latitude>' + _NUMBER + r')\s*(?:[\t,]|$)')
+
+
+# 文本布局对应的正则表达式
+TEXT_PATTERNS = {'text': TEXT_PATTERN, 'delimited': DELIMITED_PATTERN}
+
+
+def _is_numeric(values):
+    """字符串列是否全部为数值"""
+    return bool(len(values)) and pd.to_numeric(values, errors='coerce').notna().all()
+
+
+def table_layout(sample):
+    """
+    由样本(无表头读取的字符串表)判断列布局
+
+    返回 (布局, 跳过的表头行数)，布局为 columns(按列名读取)、name_lng_lat(三列无列名)，
+    其余按单元格文本判断为 text 或 delimited。
+    """
+    if len(sample) and set(COLUMNS) <= set(sample.iloc[0].astype(str).str.strip()):
+        return 'columns', 0
+    if sample.shape[1] == 3 and len(sample):
+        # 第一行不是数值时视为表头
+        header = 0 if _is_numeric(sample.iloc[:1, 1]) and _is_numeric(sample.iloc[:1, 2]) else 1
+        if _is_numeric(sample.iloc[header:, 1]) and _is_numeric(sample.iloc[header:, 2]):
+            return 'name_lng_lat', header
+    return text_layout(sample.stack()), 0
+
+
+def text_layout(lines):
+    """由样本文本行判断文件的主要文本格式: text(名称 (经度, 纬度)) 或 delimited(Tab/逗号分隔)"""
+    lines = lines.dropna().astype(str).str.strip()
+    text = lines.str.match(TEXT_PATTERN).sum()
+    delimited = lines.str.match(DELIMITED_PATTERN).sum()
+    return 'delimited' if delimited > text else 'text'
+
+
+def _sample_lines(file_path):
+    """读取文件开头的样本文本行"""
+    with open(file_path, 'r', encoding='utf-8-sig') as f:
+        return pd.Series([line for _, line in zip(range(SAMPLE_ROWS), f)], dtype=object)
+
+
+def detect_layout(file_path):
+    """判断文件的列布局，每个文件只判断一次，返回 (布局, 跳过的表头行数)"""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise ValueError(f"Unsupported file format: {ext}")
+    if ext in ('.xlsx', '.xls'):
+        # Excel在整表读入后再判断
+        return None, 0
+    if ext == '.csv':
+        try:
+            sample = pd.read_csv(file_path, header=None, nrows=SAMPLE_ROWS, dtype=str, encoding='utf-8-sig',
+                                 skipinitialspace=True)
+            layout, skip = table_layout(sample)
+            if layout not in TEXT_PATTERNS:
+                return layout, skip
+        except (ValueError, pd.errors.ParserError):
+            # 列数不一致等无法按表格读取的文件按文本处理
+            pass
+    return text_layout(_sample_lines(file_path)), 0
+
+
+def _extract(lines, pattern):
+    """对整列文本做正则提取，返回以命名分组为列的DataFrame，未匹配的行为空值"""
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        return lines.str.extract(pattern)
+    # pyarrow的RE2引擎在C++中逐行匹配，比Python的re快数倍
+    matched = pc.extract_regex(pa.array(lines.to_numpy(dtype=object), type=pa.string()), pattern.pattern)
+    fields = matched.flatten()
+    return pd.DataFrame({field.name: column.to_numpy(zero_copy_only=False)
+                         for field, column in zip(matched.type, fields)}, index=lines.index)
+
+
+def extract_text_coordinates(lines, layout='text'):
+    """
+    从文本行(字符串Series)中向量化提取坐标
+
+    先按文件的主要格式layout匹配，未匹配的行再尝试另一种格式。返回列为name、latitude、longitude的DataFrame。
+    """
+    lines = lines.dropna().astype(str).str.strip()
+    lines = lines[lines != '']
+    primary = TEXT_PATTERNS[layout]
+    found = _extract(lines, primary)
+    rest = found['name'].isna()
+    if rest.any():
+        secondary = DELIMITED_PATTERN if primary is TEXT_PATTERN else TEXT_PATTERN
+        found.loc[rest] = _extract(lines[rest], secondary)[found.columns].to_numpy()
+    found = found.dropna()
+    found['name'] = found['name'].str.strip().str.rstrip(' \t,;')
+    return found[COLUMNS]
+
+
+def _to_batch(frame):
+    """将名称、纬度、经度列转换为列式数组，去掉坐标无效的行"""
+    latitude = pd.to_numeric(frame['latitude'], errors='coerce').to_numpy(dtype=np.float64)
+    longitude = pd.to_numeric(frame['longitude'], errors='coerce').to_numpy(dtype=np.float64)
+    valid = np.isfinite(latitude) & np.isfinite(longitude)
+    return {
+        'name': frame['name'].astype(str).str.strip().to_numpy(dtype=object)[valid],
+        'latitude': latitude[valid],
+        'longitude': longitude[valid],
+    }
+
+
+def _table_chunks(frame, layout, skip, chunk_rows):
+    """将已读入的表格(Excel)按块转换为名称、纬度、经度列"""
+    if layout == 'columns':
+        # 第一行为表头
+        frame.columns = frame.iloc[0].astype(str).str.strip()
+        frame = frame.iloc[1:]
+        frame = frame.loc[:, ~frame.columns.duplicated()][COLUMNS]
+    elif layout == 'name_lng_lat':
+        frame = frame.iloc[skip:]
+        frame.columns = ['name', 'longitude', 'latitude']
+    else:
+        # 按单元格逐个作为文本行解析
+        frame = frame.stack()
+    for start in range(0, len(frame), chunk_rows):
+        chunk = frame.iloc[start:start + chunk_rows]
+        yield extract_text_coordinates(chunk, layout) if layout in TEXT_PATTERNS else chunk
+
+
+def iter_coordinate_batches(file_path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    按块读取坐标文件
+
+    每块为 {'name': 名称数组, 'latitude': 纬度数组, 'longitude': 经度数组}，坐标无效的行被丢弃。
+    """
+    layout, skip = detect_layout(file_path)
+    ext = os.path.splitext(file_path)[1].lower()
+
+    if ext in ('.xlsx', '.xls'):
+        frame = pd.read_excel(file_path, header=None, dtype=str)
+        chunks = _table_chunks(frame, *table_layout(frame.head(SAMPLE_ROWS)), chunk_rows)
+    elif layout == 'columns':
+        chunks = pd.read_csv(file_path, usecols=lambda column: column.strip() in COLUMNS, dtype=str,
+                             encoding='utf-8-sig', skipinitialspace=True, chunksize=chunk_rows)
+    elif layout == 'name_lng_lat':
+        chunks = pd.read_csv(file_path, header=None, skiprows=skip, usecols=[0, 1, 2],
+                             names=['name', 'longitude', 'latitude'], dtype=str, encoding='utf-8-sig',
+                             skipinitialspace=True, chunksize=chunk_rows)
+    else:
+        # 逐行文本：每行作为一个字符串读入(不拆分列、不处理引号)，按块向量化提取
+        lines = pd.read_csv(file_path, header=None, names=['line'], sep='\x01', dtype=str, encoding='utf-8-sig',
+                            quoting=csv.QUOTE_NONE, skip_blank_lines=True, chunksize=chunk_rows)
+        chunks = (extract_text_coordinates(chunk['line'], layout) for chunk in lines)
+
+    for chunk in chunks:
+        if layout == 'columns' and ext == '.csv':
+            chunk.columns = chunk.columns.str.strip()
+        batch = _to_batch(chunk)
+        if len(batch['name']):
+            yield batch
+
+
+def read_coordinates(file_path, chunk_rows=DEFAULT_CHUNK_ROWS, progress=None):
+    """
+    读取坐标文件的全部起始点
+
+    返回列为name、latitude、longitude的DataFrame。progress(rows)在每块读取后报告已读取的点数。
+    """
+    batches = []
+    rows = 0
+    for batch in iter_coordinate_batches(file_path, chunk_rows):
+        batches.append(batch)
+        rows += len(batch['name'])
+        if progress is not None:
+            progress(rows)
+    if not batches:
+        return pd.DataFrame({'name': np.array([], dtype=object), 'latitude': np.array([], dtype=np.float64),
+                             'longitude': np.array([], dtype=np.float64)})
+    return pd.DataFrame({column: np.concatenate([batch[column] for batch in batches]) for column in COLUMNS})
@@ -0,0 +1,97 @@
+"""
+边通行成本配置模块
+
+- 每个路网只从边表中提取一次长度与是否为台阶(highway=steps)两列，各配置的成本由这两列向量化计算
+- 成本统一以"等效步行距离(米)"表示：按该配置通行所需的时间，以标准步速能走的距离。
+  因此步行距离、等时圈环与缓存的含义在各配置下保持一致，时间类配置下1000米即标准步速步行1000米所需的时间
+- 可选配置:
+  distance(路网长度)、walking(按设定步速的步行时间，台阶减速)、
+  elderly(按老年人步速的步行时间，台阶减速更多)、steps(路网长度，台阶按倍数加罚，适合推婴儿车、轮椅等避开台阶)、
+  hills(按设定步速与DEM坡度的步行时间，需要本地DEM文件，见elevation)
+"""
+import os
+
+import numpy as np
+
+# 可选的成本配置
+COST_PROFILES = ('distance', 'walking', 'elderly', 'steps', 'hills')
+
+# 需要DEM文件的成本配置
+ELEVATION_PROFILES = ('hills',)
+
+# 标准步速(km/h)，等效步行距离按此步速换算
+REFERENCE_SPEED = 4.8
+
+# 默认步速(km/h)与老年人步速(km/h)
+WALKING_SPEED = 4.8
+ELDERLY_SPEED = 3.0
+
+# 台阶上的步速相对平路的比例: 普通步行与老年人
+STEPS_SPEED_FACTOR = 0.5
+ELDERLY_STEPS_SPEED_FACTOR = 0.3
+
+# steps配置中台阶长度的加罚倍数
+STEPS_PENALTY = 5.0
+
+# hills配置下相对平路步速的最大比例(Tobler函数在约5%的下坡最快，约为平路的1.19倍)
+HILLS_MAX_SPEEDUP = 1.2
+
+
+def steps_mask(edges):
+    """
+    边表中为台阶的边的布尔数组
+
+    osmnx合并的边的highway可能是列表，按字符串整列匹配即可覆盖。
+    """
+    if 'highway' not in edges:
+        return np.zeros(len(edges), dtype=bool)
+    return edges['highway'].astype(str).str.contains('steps', regex=False).to_numpy(dtype=bool)
+
+
+def edge_costs(lengths, steps, profile='distance', walking_speed=WALKING_SPEED):
+    """
+    由边长度(米)与台阶掩码向量化计算一种配置的边成本(等效步行距离，米)
+
+    walking_speed(km/h)只用于walking配置；hills配置需要路网几何与DEM，由 elevation.edge_hiking_costs 计算。
+    """
+    lengths = np.asarray(lengths, dtype=np.float64)
+    if profile == 'distance':
+        return lengths.copy()
+    if profile == 'steps':
+        return np.where(steps, lengths * STEPS_PENALTY, lengths)
+    if profile == 'walking':
+        speed, steps_factor = walking_speed, STEPS_SPEED_FACTOR
+    elif profile == 'elderly':
+        speed, steps_factor = ELDERLY_SPEED, ELDERLY_STEPS_SPEED_FACTOR
+    else:
+        raise ValueError(f"Unknown cost profile: {profile}")
+    if speed <= 0:
+        raise ValueError(f"Walking speed must be positive: {speed}")
+    # 所需时间 x 标准步速 = 等效步行距离
+    return lengths * (REFERENCE_SPEED / speed) / np.where(steps, steps_factor, 1.0)
+
+
+def dem_key(dem_path):
+    """区分DEM文件的键: 文件名、大小与修改时间，文件被替换时不会误用旧成本"""
+    stat = os.stat(dem_path)
+    return f'{os.path.basename(dem_path)}:{stat.st_size}:{int(stat.st_mtime)}'
+
+
+def profile_key(profile='distance', walking_speed=WALKING_SPEED, dem_path=None):
+    """区分成本配置的键，walking与hills配置与步速有关，hills配置还与DEM文件有关"""
+    if profile in ELEVATION_PROFILES:
+        if not dem_path:
+            raise ValueError(f"Cost profile {profile} requires a DEM file")
+        return f'{profile}@{walking_speed:g}|{dem_key(dem_path)}'
+    return f'{profile}@{walking_speed:g}' if profile == 'walking' else profile
+
+
+def reach_factor(profile='distance', walking_speed=WALKING_SPEED):
+    """每米成本(等效步行距离)最多对应的实际距离，用于确定路网下载范围"""
+    if profile == 'walking':
+        return walking_speed / REFERENCE_SPEED
+    if profile == 'elderly':
+        return ELDERLY_SPEED / REFERENCE_SPEED
+    if profile in ELEVATION_PROFILES:
+        return walking_speed / REFERENCE_SPEED * HILLS_MAX_SPEEDUP
+    return 1.0
@@ -0,0 +1,105 @@
+"""
+地形高程成本模块
+
+- 从本地GeoTIFF数字高程模型(DEM)读取高程，每个路网一次性采样全部边的端点与折点
+- 按Tobler徒步函数由坡度计算各路段的步速，上坡、陡峭的下坡比平路慢
+- 结果为与边表逐行对应的成本数组(等效步行距离，见cost_profiles)，作为hills配置随路网保存，之后的起始点不再计算
+- 需要rasterio
+"""
+import numpy as np
+from pyproj import Transformer
+
+from cost_profiles import REFERENCE_SPEED, STEPS_SPEED_FACTOR
+
+# Tobler徒步函数的参数: 步速 ∝ exp(-TOBLER_SLOPE_FACTOR * |坡度 + TOBLER_SLOPE_OFFSET|)
+TOBLER_SLOPE_FACTOR = 3.5
+TOBLER_SLOPE_OFFSET = 0.05
+
+# 坡度上限，避免桥梁、隧道处DEM与路网高差过大造成的异常坡度
+MAX_SLOPE = 1.0
+
+# 分块读取DEM的块边长(像元)：只读取含有采样点的块，内存随块大小而非DEM范围增长
+DEM_BLOCK_SIZE = 1024
+
+
+def sample_dem(dem_path, x, y, crs):
+    """
+    在路网坐标系crs下的坐标数组处一次性采样DEM高程(最近像元)
+
+    DEM按 DEM_BLOCK_SIZE 分块，只读取含有采样点的块(原始数据类型)，只有采样值转换为浮点数；
+    高分辨率DEM覆盖大范围区域时内存也不随DEM范围增长。DEM范围外或无数据的位置为NaN。
+    """
+    try:
+        import rasterio
+        from rasterio.windows import Window
+    except ImportError:
+        raise ImportError("Elevation costs require rasterio: pip install rasterio")
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    z = np.full(len(x), np.nan)
+    if not len(x):
+        return z
+    with rasterio.open(dem_path) as src:
+        if src.crs is not None:
+            x, y = Transformer.from_crs(crs, src.crs.to_wkt(), always_xy=True).transform(x, y)
+            x, y = np.asarray(x), np.asarray(y)
+        # 由仿射变换系数直接求像元行列号(数组运算，不逐点调用)
+        t = src.transform
+        det = t.a * t.e - t.b * t.d
+        cols = np.floor((t.e * (x - t.c) - t.b * (y - t.f)) / det).astype(np.int64)
+        rows = np.floor((t.a * (y - t.f) - t.d * (x - t.c)) / det).astype(np.int64)
+        inside = np.flatnonzero((rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width))
+        if not len(inside):
+            return z
+        # 按所在块对采样点排序，逐块读取
+        block_rows, block_cols = rows[inside] // DEM_BLOCK_SIZE, cols[inside] // DEM_BLOCK_SIZE
+        blocks = block_rows * ((src.width - 1) // DEM_BLOCK_SIZE + 1) + block_cols
+        order = np.argsort(blocks, kind='stable')
+        splits = np.flatnonzero(np.diff(blocks[order])) + 1
+        for points in np.split(inside[order], splits):
+            row0 = rows[points[0]] // DEM_BLOCK_SIZE * DEM_BLOCK_SIZE
+            col0 = cols[points[0]] // DEM_BLOCK_SIZE * DEM_BLOCK_SIZE
+            window = Window(col0, row0, min(DEM_BLOCK_SIZE, src.width - col0), min(DEM_BLOCK_SIZE, src.height - row0))
+            band = src.read(1, window=window, masked=True)
+            z[points] = band[rows[points] - row0, cols[points] - col0].astype(np.float64).filled(np.nan)
+    return z
+
+
+def tobler_factor(slope):
+    """Tobler徒步函数的步速相对平路步速的比例"""
+    return np.exp(-TOBLER_SLOPE_FACTOR * np.abs(slope + TOBLER_SLOPE_OFFSET)) / np.exp(
+        -TOBLER_SLOPE_FACTOR * TOBLER_SLOPE_OFFSET)
+
+
+def edge_hiking_costs(coords, index, lengths, steps, dem_path, crs, walking_speed):
+    """
+    按DEM坡度计算边成本(等效步行距离，米)
+
+    coords为全部边几何的折点坐标，index为每个折点所属的边。边几何按u到v的方向拆分为路段，各路段按几何长度占比分摊边长度，以 平路步速walking_speed x Tobler比例 通行；
+    无高程的路段按平路计算，台阶与walking配置一样减速。
+    """
+    if walking_speed <= 0:
+        raise ValueError(f"Walking speed must be positive: {walking_speed}")
+    lengths = np.asarray(lengths, dtype=np.float64)
+    z = sample_dem(dem_path, coords[:, 0], coords[:, 1], crs)
+
+    # 同一条边上相邻折点之间的路段
+    same = index[1:] == index[:-1]
+    segment_edge = index[:-1][same]
+    run = np.hypot(*np.diff(coords, axis=0)[same].T)
+    rise = np.diff(z)[same]
+    slope = np.divide(rise, run, out=np.zeros_like(run), where=run > 0)
+    slope = np.clip(np.nan_to_num(slope, nan=0.0), -MAX_SLOPE, MAX_SLOPE)
+
+    geometry_length = np.bincount(segment_edge, weights=run, minlength=len(lengths))
+    share = np.divide(run, geometry_length[segment_edge], out=np.zeros_like(run),
+                      where=geometry_length[segment_edge] > 0)
+    # 所需时间 x 标准步速 = 路段长度 x 标准步速 / 坡度上的步速
+    segment_costs = lengths[segment_edge] * share * REFERENCE_SPEED / (walking_speed * tobler_factor(slope))
+    costs = np.bincount(segment_edge, weights=segment_costs, minlength=len(lengths))
+
+    # 没有几何长度的边按平路计算
+    flat = geometry_length <= 0
+    costs[flat] = lengths[flat] * REFERENCE_SPEED / walking_speed
+    return costs / np.where(steps, STEPS_SPEED_FACTOR, 1.0)
@@ -0,0 +1,142 @@
+"""
+路网磁盘缓存模块
+
+- 以二进制(pickle)格式保存投影并转换后的紧凑数组路网(routing.CSRGraph)，避免重复下载、投影和转换
+- 缓存键由区域范围、路网类型、OSM数据快照和缓存格式组成，旧格式的缓存条目不再使用，按LRU逐步淘汰
+- 超出磁盘预算时按最近使用时间(LRU)淘汰旧缓存
+"""
+import hashlib
+import json
+import os
+import pickle
+import re
+
+import osmnx as ox
+
+# 默认缓存目录与容量(MB)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.isochrone_cache', 'graphs')
+DEFAULT_CACHE_SIZE_MB = 2048
+
+# 缓存条目的格式: 紧凑数组路网
+CACHE_FORMAT = 'csr1'
+
+
+def current_snapshot():
+    """从osmnx的Overpass设置中读取数据快照日期，未指定时视为最新数据"""
+    match = re.search(r'\[date:"([^"]+)"\]', ox.settings.overpass_settings or '')
+    return match.group(1) if match else 'latest'
+
+
+class GraphCache:
+    """紧凑数组路网的磁盘缓存，按最近使用时间淘汰"""
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size_mb=DEFAULT_CACHE_SIZE_MB, snapshot=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.snapshot = snapshot or current_snapshot()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.index_path = os.path.join(self.cache_dir, 'index.json')
+        self.index = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # 丢弃文件已不存在的条目
+        return {k: v for k, v in index.items() if os.path.exists(self._path(k))}
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.pkl')
+
+    def make_key(self, bounds, network_type):
+        """由区域范围(west, south, east, north)、路网类型、数据快照和缓存格式生成缓存键"""
+        text = '|'.join([network_type, self.snapshot, CACHE_FORMAT] + [f'{b:.5f}' for b in bounds])
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def find(self, bounds, network_type):
+        """查找完全一致或完整覆盖该范围的缓存条目"""
+        key = self.make_key(bounds, network_type)
+        if key in self.index:
+            return key
+        west, south, east, north = bounds
+        candidates = []
+        for k, entry in self.index.items():
+            if (entry['network_type'] != network_type or entry['snapshot'] != self.snapshot
+                    or entry.get('format') != CACHE_FORMAT):
+                continue
+            w, s, e, n = entry['bounds']
+            if w <= west and s <= south and e >= east and n >= north:
+                candidates.append((entry['size'], k))
+        # 优先使用最小的覆盖路网
+        return min(candidates)[1] if candidates else None
+
+    def get(self, bounds, network_type):
+        """读取缓存的紧凑数组路网，未命中时返回None"""
+        key = self.find(bounds, network_type)
+        if key is None:
+            self.misses += 1
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                router = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            # 缓存文件损坏时删除该条目
+            self._remove(key)
+            self._save_index()
+            self.misses += 1
+            return None
+        # 更新访问时间，作为LRU依据
+        os.utime(self._path(key))
+        self.hits += 1
+        return router
+
+    def put(self, bounds, network_type, router):
+        """写入紧凑数组路网并按容量预算淘汰旧缓存"""
+        key = self.make_key(bounds, network_type)
+        path = self._path(key)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(router, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.index[key] = {
+            'bounds': list(bounds),
+            'network_type': network_type,
+            'snapshot': self.snapshot,
+            'format': CACHE_FORMAT,
+            'size': os.path.getsize(path),
+        }
+        self.evict(keep=key)
+        self._save_index()
+
+    def total_size(self):
+        return sum(entry['size'] for entry in self.index.values())
+
+    def evict(self, keep=None):
+        """删除最久未使用的缓存，直到总大小不超过预算"""
+        total = self.total_size()
+        if total <= self.max_bytes:
+            return
+        by_access = sorted(self.index, key=lambda k: os.path.getmtime(self._path(k)))
+        for key in by_access:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self.index[key]['size']
+            self._remove(key)
+
+    def _remove(self, key):
+        self.index.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
@@ -2,40 +2,72 @@ import sys
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QLabel, 
                             QVBoxLayout, QHBoxLayout, QFileDialog, QWidget, 
                             QProgressBar, QTextEdit, QGroupBox, QFormLayout, 
-                            QSpinBox, QComboBox, QMessageBox, QTabWidget)
+                            QSpinBox, QComboBox, QMessageBox, QTabWidget,
+                            QCheckBox, QLineEdit, QDoubleSpinBox)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
 import os
-import pandas as pd
 import re
-import osmnx as ox
-import networkx as nx
-import matplotlib.pyplot as plt
-from shapely.geometry import Point, LineString, Polygon
-from shapely.ops import unary_union
-import geopandas as gpd
-import contextily as cx
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
-from matplotlib_scalebar.scalebar import ScaleBar
-import matplotlib as mpl
-from pypinyin import lazy_pinyin
 
 # 导入地图选点模块
 from map_selector import MapSelector
-
-# Force matplotlib to use English fonts
-mpl.rcParams['font.family'] = ['DejaVu Sans', 'Arial', 'Helvetica', 'sans-serif']
-plt.rcParams['axes.unicode_minus'] = False
+# 导入区域路网模块
+from regional_graph import RegionalGraphProvider, boundary_reaches, fetch_radius
+# 导入路网缓存模块
+from graph_cache import GraphCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE_MB, current_snapshot
+# 导入数组路网模块
+from routing import group_origins, FAR_SNAP_DISTANCE, SNAP_MODES
+from cost_profiles import COST_PROFILES, ELEVATION_PROFILES, WALKING_SPEED, reach_factor
+# 导入单点等时圈处理流程
+from isochrone_pipeline import (IsochroneSettings, to_pinyin, process_points, process_points_task,
+                                save_router, rerender_cached, VIEW_HALF_WIDTH)
+from map_renderer import RENDER_PROFILES
+from vector_export import BatchVectorSink, VECTOR_FORMATS, batch_vector_path
+from run_manifest import RunManifest, graph_version, pending_points
+from isochrone_polygon import POLYGON_METHODS
+from tile_cache import TileCache, BasemapMosaic, DEFAULT_TILE_DIR
+from session_cache import SessionCache, search_radius
+from coordinate_reader import read_coordinates
 
 class IsochroneWorker(QThread):
     progress_update = pyqtSignal(str, int)
     finished = pyqtSignal(bool, str)
     
-    def __init__(self, input_file=None, output_dir="isochrone_output", distance=1000, points_data=None):
+    def __init__(self, input_file=None, output_dir="isochrone_output", distance=1000, points_data=None,
+                 regional=True, cache_size_mb=DEFAULT_CACHE_SIZE_MB, workers=1, method='buffer',
+                 raster_resolution=5, offline_tiles=False,
+                 basemap_mosaic=False, render_profile='publication', vector_format='gpkg',
+                 write_shapefile=False, resume=True, session_cache=None, merge_tolerance=0, snap='edge',
+                 profile='distance', walking_speed=WALKING_SPEED, dem_path=None):
         super().__init__()
         self.input_file = input_file
         self.output_dir = output_dir
-        self.distance = distance
+        # distance可以是单个距离，也可以是多个距离(同时生成多个等时圈环)
+        self.distances = sorted(set(distance)) if isinstance(distance, (list, tuple)) else [distance]
+        self.distance = self.distances[-1]  # 最大距离，即最短路径计算的上限
+        self.distance_label = '-'.join(str(d) for d in self.distances)
         self.points_data = points_data  # 添加直接接收坐标点数据的能力
+        self.regional = regional  # 邻近点共享一个区域路网
+        self.cache_size_mb = cache_size_mb  # 路网磁盘缓存容量(MB)，0表示不使用缓存
+        self.workers = workers  # 并行进程数，1表示在当前线程中逐点处理
+        self.method = method  # 等时圈多边形构建方法
+        self.raster_resolution = raster_resolution  # 栅格方法的网格分辨率(米)
+        self.offline_tiles = offline_tiles  # 只使用本地缓存的底图瓦片
+        self.basemap_mosaic = basemap_mosaic  # 为全部点拼接一张整体底图，逐点切片
+        self.render_profile = render_profile  # 绘图配置: publication 或 preview
+        self.vector_format = vector_format  # 批量矢量输出格式: gpkg、parquet 或 none
+        self.write_shapefile = write_shapefile  # 是否为每个点单独保存Shapefile
+        self.resume = resume  # 跳过输出目录中已用相同输入完成的点
+        self.session_cache = session_cache  # 会话内保留的区域路网与最短距离(SessionCache)，为None时不保留
+        self.merge_tolerance = merge_tolerance  # 相距不超过该距离(米)的起始点合并计算，0表示只合并定位到同一位置的点
+        self.snap = snap  # 起始点定位方式: edge(最近的边上的投影点) 或 node(最近的节点)
+        self.profile = profile  # 边成本配置: distance、walking、elderly 或 steps
+        self.walking_speed = walking_speed  # walking与hills配置的平路步速(km/h)
+        self.dem_path = dem_path  # hills配置使用的DEM文件(GeoTIFF)
         
     def run(self):
         try:
@@ -50,24 +82,11 @@ class IsochroneWorker(QThread):
                 # 从文件读取坐标数据
                 self.progress_update.emit("Reading coordinates data...", 0)
                 
-                # 处理不同格式的文件
-                file_ext = os.path.splitext(self.input_file)[1].lower()
-                
-                # 根据文件类型读取数据
-                if file_ext == '.csv':
-                    # 使用pandas读取CSV
-                    self.progress_update.emit("Reading CSV file...", 5)
-                    coordinates = self.read_csv_file(self.input_file)
-                elif file_ext == '.txt':
-                    # 读取文本文件
-                    self.progress_update.emit("Reading text file...", 5)
-                    coordinates = self.read_text_file(self.input_file)
-                elif file_ext in ['.xlsx', '.xls']:
-                    # 读取Excel文件
-                    self.progress_update.emit("Reading Excel file...", 5)
-                    coordinates = self.read_excel_file(self.input_file)
-                else:
-                    raise Exception(f"Unsupported file format: {file_ext}")
+                # 按块读取坐标文件，文件格式与列布局只判断一次
+                coordinates = read_coordinates(
+                    self.input_file,
+                    progress=lambda rows: self.progress_update.emit(f"Read {rows} points...", 5)
+                ).to_dict('records')
             else:
                 raise Exception("No input data provided")
                 
@@ -82,347 +101,301 @@ class IsochroneWorker(QThread):
                 os.makedirs(self.output_dir)
                 self.progress_update.emit(f"Created output directory: {self.output_dir}", 10)
                 
+            settings = IsochroneSettings(self.distances, self.output_dir, method=self.method,
+                                         raster_resolution=self.raster_resolution,
+                                         basemap=TileCache(DEFAULT_TILE_DIR, offline=self.offline_tiles),
+                                         render_profile=self.render_profile,
+                                         write_shapefile=self.write_shapefile, snap=self.snap,
+                                         profile=self.profile, walking_speed=self.walking_speed,
+                                         dem_path=self.dem_path, merge_tolerance=self.merge_tolerance)
+            cache = GraphCache(DEFAULT_CACHE_DIR, self.cache_size_mb) if self.cache_size_mb > 0 else None
+            snapshot = cache.snapshot if cache is not None else current_snapshot()
+            
+            # 全部点的等时圈批量写入同一个矢量图层
+            self.sink = None
+            if self.vector_format != 'none':
+                self.sink = BatchVectorSink(batch_vector_path(self.output_dir, self.distance_label, self.vector_format),
+                                            self.vector_format)
+            
+            # 断点续跑：跳过输出目录中已用相同输入完成的点，只计算新增或参数改变的点
+            self.manifest = RunManifest(self.output_dir, settings,
+                                        graph_version(snapshot=snapshot))
+            if self.resume:
+                todo, skipped = pending_points(coordinates, self.manifest, self.sink)
+                if skipped:
+                    coordinates = [coordinates[i] for i in todo]
+                    self.progress_update.emit(f"Skipping {skipped} points already finished in {self.output_dir}", 10)
+            if not coordinates:
+                if self.sink is not None:
+                    self.sink.close()
+                self.finished.emit(True, "All points were already finished, nothing to do")
+                return
+            
             # 计算总进度比例
             total_points = len(coordinates)
-            points_processed = 0
+            self.total_points = total_points
+            self.points_processed = 0
             
-            # 遍历处理每个坐标点
-            for coord in coordinates:
-                points_processed += 1
-                point_progress_base = 10 + (points_processed - 1) * 90 / total_points
-                
-                name = coord['name']
-                lat = coord['latitude']
-                lng = coord['longitude']
-                
-                # 将站点名称转换为拼音/英文
-                name_pinyin = self.to_pinyin(name)
+            # 将坐标点划分为路网区域，区域内的点共享同一个路网
+            # 下载范围由最大步行距离(及成本配置的最快步速)加绕行余量确定
+            provider = RegionalGraphProvider(coordinates,
+                                             fetch_distance=fetch_radius(self.distance, reach_factor(self.profile, self.walking_speed)),
+                                             regional=self.regional, cache=cache)
+            # 会话内下载的路网覆盖最短距离的搜索半径(带余量)，之后在余量内调大步行距离时仍可复用路网与最短距离
+            session_fetch_distance = fetch_radius(search_radius(self.distance), reach_factor(self.profile, self.walking_speed))
+            self.progress_update.emit(f"Planned {len(provider.regions)} network regions for {total_points} points", 10)
+            
+            # 临时文件目录：并行模式的区域路网、整体底图
+            work_dir = tempfile.mkdtemp(prefix='isochrone_')
+            
+            # 并行模式：逐点的绘图与输出分发到进程池，区域路网数组写入临时目录，子进程以内存映射共用
+            executor = None
+            pending = {}
+            if self.workers > 1:
+                executor = ProcessPoolExecutor(max_workers=self.workers,
+                                               mp_context=multiprocessing.get_context('spawn'))
+                self.progress_update.emit(f"Processing points with {self.workers} parallel workers", 10)
+            
+            try:
+                if self.basemap_mosaic:
+                    settings.basemap = self.build_mosaic(settings.basemap, coordinates, work_dir)
                 
-                self.progress_update.emit(f"Processing point {points_processed}/{total_points}: {name}", point_progress_base)
+                # 遍历每个路网区域(到达路网边界而扩大范围的区域追加在列表末尾，随后处理)
+                for region_number, region in enumerate(provider.regions):
+                    region_progress_base = self.overall_progress()
+                    
+                    # 步骤1: 数据准备 - 获取路网数据(每个区域只下载一次，会话内保留最近使用的区域)
+                    self.progress_update.emit(f"Step 1/4: Downloading network data for {region}...", region_progress_base)
+                    # 会话中保留的路网范围覆盖该区域所需范围时直接复用(network_region为路网实际的下载区域)
+                    region_key, network_region, router = (
+                        self.session_cache.find_region(region.extent, provider.network_type, snapshot)
+                        if self.session_cache is not None else (None, None, None))
+                    if router is not None:
+                        self.progress_update.emit(f"Network reused from this session: {router.n_nodes} nodes, {len(router.edge_u)} edges", region_progress_base)
+                    else:
+                        network_region = provider.padded(region, session_fetch_distance) if self.session_cache is not None else region
+                        try:
+                            # 区域路网以紧凑CSR数组的形式读取，供区域内所有点计算最短路径
+                            router, from_cache = provider.load_graph(network_region)
+                        except Exception as e:
+                            self.progress_update.emit(f"Error downloading network for {region}: {str(e)}", region_progress_base)
+                            self.points_processed += len(region.indices)
+                            continue
+                        source = "loaded from cache" if from_cache else "downloaded"
+                        self.progress_update.emit(f"Network {source}: {router.n_nodes} nodes, {len(router.edge_u)} edges, {router.nbytes / 1024 / 1024:.1f} MB", region_progress_base)
+                        if self.session_cache is not None:
+                            region_key = self.session_cache.put_region(network_region, provider.network_type, snapshot, router)
+                        else:
+                            region_key = SessionCache.region_key(network_region.extent, provider.network_type, snapshot)
+                    # 按所选成本配置取路网视图(会话中保留的路网不被修改，各配置的成本只计算一次)
+                    router = router.with_profile(self.profile, self.walking_speed, self.dem_path)
+                    graph_key = SessionCache.graph_key(region_key, router)
+                    
+                    # 步骤2: 路网分析 - 批量定位区域内的所有起始点，定位到同一位置(或相距很近)的起始点归为一组
+                    self.progress_update.emit(f"Step 2/4: Locating {len(region.indices)} points in walking network...", region_progress_base)
+                    try:
+                        origins, snap_dist, origin_x, origin_y = self.locate_origins(
+                            router, graph_key, [coordinates[index] for index in region.indices])
+                    except Exception as e:
+                        self.progress_update.emit(f"Error locating points for {region}: {str(e)}", region_progress_base)
+                        self.points_processed += len(region.indices)
+                        continue
+                    for position in np.flatnonzero(snap_dist > FAR_SNAP_DISTANCE):
+                        self.progress_update.emit(f"Warning: {coordinates[region.indices[position]]['name']} is {snap_dist[position]:.0f}m from the nearest walking network {self.snap}", region_progress_base)
+                    groups = group_origins(origins, origin_x, origin_y, settings.merge_tolerance)
+                    if len(groups) < len(region.indices):
+                        self.progress_update.emit(f"{len(region.indices)} points share {len(groups)} starting positions, each is computed once", region_progress_base)
+                    
+                    # 步骤3: 等时圈计算 - 一次计算区域内所有起始节点的最短距离(会话内已算过的起始点直接复用)
+                    self.progress_update.emit(f"Step 3/4: Calculating {self.distance_label}m walking ranges for {len(groups)} points...", region_progress_base)
+                    try:
+                        reaches = self.origin_distances(router, graph_key, [origins[group[0]] for group in groups])
+                    except Exception as e:
+                        self.progress_update.emit(f"Error calculating walking ranges for {region}: {str(e)}", region_progress_base)
+                        self.points_processed += len(region.indices)
+                        continue
+                    
+                    # 到达路网边界的起始点：扩大下载范围，随后作为新区域重新计算
+                    truncated = boundary_reaches(network_region, router, reaches)
+                    if truncated:
+                        positions = np.concatenate([groups[i] for i in truncated])
+                        expanded = provider.expand(region, positions, fetch_distance=network_region.fetch_distance)
+                        if expanded is None:
+                            self.progress_update.emit(f"Warning: walking ranges of {len(positions)} points reach the network boundary and may be truncated", region_progress_base)
+                        else:
+                            self.progress_update.emit(f"Walking ranges of {len(positions)} points reach the network boundary, reloading them with a {expanded.fetch_distance:.0f}m extent", region_progress_base)
+                            keep = [i for i in range(len(groups)) if i not in set(truncated)]
+                            groups = [groups[i] for i in keep]
+                            reaches = [reaches[i] for i in keep]
+                    
+                    if executor is not None:
+                        router_path = save_router(router, os.path.join(work_dir, f'region_{region_number}'))
+                    
+                    # 遍历处理每组坐标点：等时圈只构建一次，再为组内每个点分别输出
+                    for group, (reach, reach_dist) in zip(groups, reaches):
+                        points = []
+                        for position in group:
+                            point = dict(coordinates[region.indices[position]])
+                            # 将站点名称转换为拼音/英文
+                            point['name_pinyin'] = to_pinyin(point['name'])
+                            points.append(point)
+                        
+                        if executor is not None:
+                            # 提交到进程池，结果在完成后汇报
+                            future = executor.submit(process_points_task, router_path, points, reach, reach_dist, settings)
+                            pending[future] = points
+                            continue
+                        
+                        point_progress_base = self.overall_progress()
+                        self.points_processed += len(points)
+                        names = ', '.join(point['name'] for point in points)
+                        self.progress_update.emit(f"Processing point {self.points_processed}/{total_points}: {names}", point_progress_base)
+                        
+                        def report(message, percent, base=point_progress_base, count=len(points)):
+                            self.progress_update.emit(message, int(base + percent * 90 * count / total_points / 100))
+                        
+                        try:
+                            # 生成等时圈
+                            results = process_points(router, points, reach, reach_dist, settings, progress=report)
+                            for point, (output_filename, isochrone_wgs84) in zip(points, results):
+                                if self.sink is not None:
+                                    self.sink.add(isochrone_wgs84)
+                                self.manifest.record(point, output_filename)
+                        except Exception as e:
+                            self.progress_update.emit(f"Error processing point {names}: {str(e)}", point_progress_base)
+                            continue
+                    
+                    # 释放区域路网
+                    del router, reaches
+                    
+                    # 汇报已完成的并行任务
+                    self.collect_results(pending, block=False)
                 
-                try:
-                    # 生成等时圈
-                    self.generate_isochrone(lat, lng, name, name_pinyin, point_progress_base)
-                except Exception as e:
-                    self.progress_update.emit(f"Error processing point {name}: {str(e)}", point_progress_base)
-                    continue
+                # 等待剩余的并行任务
+                self.collect_results(pending, block=True)
+            finally:
+                if executor is not None:
+                    executor.shutdown(cancel_futures=True)
+                shutil.rmtree(work_dir, ignore_errors=True)
+                if self.sink is not None:
+                    self.sink.close()
             
+            if self.sink is not None and self.sink.rows_written:
+                self.progress_update.emit(f"Saved {self.sink.rows_written} isochrones to {self.sink.path}", 100)
             self.finished.emit(True, "All points processed successfully!")
         except Exception as e:
             self.finished.emit(False, f"Error: {str(e)}")
             
-    def to_pinyin(self, text):
-        """将中文文本转换为拼音"""
+    def build_mosaic(self, tile_cache, coordinates, work_dir):
+        """拼接覆盖全部点视图的整体底图，失败时退回逐点读取瓦片缓存"""
+        self.progress_update.emit("Building basemap mosaic for all points...", 10)
         try:
-            # 先尝试使用pypinyin转拼音
-            pinyin = ''.join(lazy_pinyin(text))
-            # 如果结果为空或与原文相同，使用简单的替换方法
-            if not pinyin or pinyin == text:
-                # 移除非ASCII字符
-                ascii_text = re.sub(r'[^\x00-\x7F]+', '', text)
-                return ascii_text.strip() if ascii_text.strip() else "Station"
-            return pinyin
-        except:
-            # 出错时使用简单的替换方法
-            ascii_text = re.sub(r'[^\x00-\x7F]+', '', text)
-            return ascii_text.strip() if ascii_text.strip() else "Station"
+            mosaic = BasemapMosaic.build(tile_cache, [c['latitude'] for c in coordinates],
+                                         [c['longitude'] for c in coordinates], VIEW_HALF_WIDTH,
+                                         os.path.join(work_dir, 'basemap.npy'),
+                                         zoom=RENDER_PROFILES[self.render_profile]['zoom'])
+        except Exception as e:
+            self.progress_update.emit(f"Error building basemap mosaic, using per-point tiles: {str(e)}", 10)
+            return tile_cache
+        height, width = mosaic.image.shape[:2]
+        self.progress_update.emit(f"Basemap mosaic ready: {width} x {height} pixels", 10)
+        return mosaic
+        
+    def overall_progress(self, points_processed=None):
+        """根据已处理的点数计算总进度(10%~100%)"""
+        if points_processed is None:
+            points_processed = self.points_processed
+        return int(10 + points_processed * 90 / max(self.total_points, 1))
             
-    def generate_isochrone(self, lat, lng, name, name_pinyin, base_progress):
-        """为单个坐标点生成等时圈"""
-        # 步骤1: 数据准备 - 获取路网数据
-        self.progress_update.emit(f"Step 1/4: Downloading network data for {name}...", base_progress + 5)
-        # 获取距离范围内的步行路网，确保涵盖足够区域
-        G = ox.graph_from_point((lat, lng), dist=4000, network_type='all')
-        self.progress_update.emit(f"Network downloaded: {len(G.nodes)} nodes, {len(G.edges)} edges", base_progress + 10)
-        
-        # 步骤2: 路网分析 - 投影和构建网络
-        self.progress_update.emit(f"Step 2/4: Building walking network...", base_progress + 15)
-        # 将地理坐标投影到平面坐标系统(UTM)以便进行距离计算
-        G_proj = ox.project_graph(G)
-        
-        # 创建起始点并投影到相同坐标系
-        origin_point = Point(lng, lat)
-        origin_gdf = gpd.GeoDataFrame(geometry=[origin_point], crs="EPSG:4326")
-        origin_proj = origin_gdf.to_crs(G_proj.graph['crs'])
-        origin_x, origin_y = origin_proj.geometry.x[0], origin_proj.geometry.y[0]
-        
-        # 找到路网中距离起始点最近的节点
-        origin_node = ox.distance.nearest_nodes(G_proj, X=origin_x, Y=origin_y)
-        
-        # 设置每条边的权重为长度(米)，用于后续计算
-        for u, v, data in G_proj.edges(data=True):
-            data['weight'] = data['length']
-        
-        self.progress_update.emit(f"Walking network built", base_progress + 20)
-        
-        # 步骤3: 等时圈计算 - 生成指定距离步行范围
-        self.progress_update.emit(f"Step 3/4: Calculating {self.distance}m walking range...", base_progress + 25)
-        # 计算从起始节点出发，在给定距离内可达的子图
-        subgraph = nx.ego_graph(G_proj, origin_node, radius=self.distance, distance='weight')
-        
-        # 提取子图中的节点和边
-        nodes, edges = ox.graph_to_gdfs(subgraph)
-        
-        # 生成缓冲区和合并操作，创建等时圈轮廓
-        node_buffers = nodes.buffer(15)  # 节点缓冲区
-        
-        # 为边创建缓冲区
-        edge_lines = [LineString([Point(data.geometry.coords[0]), 
-                                 Point(data.geometry.coords[-1])]) 
-                     for _, data in edges.iterrows()]
-        edge_buffers = gpd.GeoSeries(edge_lines).buffer(10)  # 边缓冲区
-        
-        # 合并所有缓冲区创建初始等时圈
-        buffers = list(node_buffers) + list(edge_buffers)
-        if buffers:
-            isochrone_polygon = unary_union(buffers)
+    def collect_results(self, pending, block):
+        """汇报进程池中已完成的任务(每个任务为共用同一起始节点的一组点)，block为True时等待全部完成"""
+        done = as_completed(list(pending)) if block else [f for f in list(pending) if f.done()]
+        for future in done:
+            points = pending.pop(future)
+            self.points_processed += len(points)
+            try:
+                for point, (output_filename, isochrone_wgs84) in zip(points, future.result()):
+                    if self.sink is not None:
+                        self.sink.add(isochrone_wgs84)
+                    self.manifest.record(point, output_filename)
+                    self.progress_update.emit(f"Point {point['name']}: saved map to {output_filename}",
+                                              self.overall_progress())
+            except Exception as e:
+                # 单点出错不影响其他点
+                names = ', '.join(point['name'] for point in points)
+                self.progress_update.emit(f"Error processing point {names}: {str(e)}", self.overall_progress())
             
-            # 平滑处理
-            isochrone_polygon = isochrone_polygon.buffer(10).buffer(-5)
+    def locate_origins(self, router, graph_key, coords):
+        """
+        批量定位起始点在路网中的起点(最近的节点或边上的投影点)，会话内同一路网中的同一坐标只定位一次
+        
+        返回 (起点列表, 定位距离数组, 投影x坐标数组, 投影y坐标数组)。
+        """
+        keys = [(graph_key, self.snap, coord['latitude'], coord['longitude']) for coord in coords]
+        known = self.session_cache.origins if self.session_cache is not None else {}
+        missing = [i for i, key in enumerate(keys) if key not in known]
+        found = {}
+        if missing:
+            # 一次投影全部起始点，并在路网节点的KD树或边的STRtree上一次查询
+            starts, snap_dist, x, y = router.locate_origins([coords[i]['latitude'] for i in missing],
+                                                            [coords[i]['longitude'] for i in missing], self.snap)
+            found = {keys[i]: value for i, value in zip(missing, zip(starts, snap_dist.tolist(), x.tolist(), y.tolist()))}
+            if self.session_cache is not None:
+                known.update(found)
+        values = [found[key] if key in found else known[key] for key in keys]
+        starts = [value[0] for value in values]
+        snap_dist, x, y = (np.array(column) for column in list(zip(*values))[1:])
+        return starts, snap_dist, x, y
             
-            # 应用Douglas-Peucker简化算法，公差为2米
-            isochrone_polygon = isochrone_polygon.simplify(2, preserve_topology=True)
+    def origin_distances(self, router, graph_key, origins):
+        """
+        各起点在最大步行距离内的 (可达节点下标, 距离) 列表
+        
+        使用会话缓存时，缓存的搜索半径覆盖最大步行距离的起始点直接取缓存结果，
+        其余起始点按带余量的搜索半径一次批量计算并写入缓存。
+        """
+        if self.session_cache is None:
+            distances = router.multi_source_distances(origins, self.distance)
+            return [router.row_distances(distances, row) for row in range(len(origins))]
+        
+        cache = self.session_cache.distances
+        reaches = [cache.get((graph_key, origin), self.distance) for origin in origins]
+        reused = sum(reach is not None for reach in reaches)
+        missing = sorted({origin for origin, reach in zip(origins, reaches) if reach is None})
+        if missing:
+            radius = search_radius(self.distance)
+            distances = router.multi_source_distances(missing, radius)
+            computed = {}
+            for row, origin in enumerate(missing):
+                reach, reach_dist = router.row_distances(distances, row)
+                cache.put((graph_key, origin), radius, reach, reach_dist)
+                keep = reach_dist <= self.distance
+                computed[origin] = (reach[keep], reach_dist[keep])
+            reaches = [reach if reach is not None else computed[origin] for origin, reach in zip(origins, reaches)]
+        if reused:
+            self.progress_update.emit(f"Reused cached walking distances for {reused} of {len(origins)} points",
+                                      self.overall_progress())
+        return reaches
             
-            # 移除等时圈内部的空洞，确保是一个完整的多边形
-            if hasattr(isochrone_polygon, 'geoms'):
-                # 处理MultiPolygon情况：取面积最大的多边形
-                largest_polygon = max(isochrone_polygon.geoms, key=lambda p: p.area)
-                # 仅保留外部环，去除内部孔洞
-                isochrone_polygon = Polygon(largest_polygon.exterior)
-            else:
-                # 处理单个Polygon情况：直接去除内部孔洞
-                isochrone_polygon = Polygon(isochrone_polygon.exterior)
-        else:
-            # 如果没有可达点，创建一个小范围圆形作为等时圈
-            isochrone_polygon = origin_proj.geometry[0].buffer(50)
-        
-        self.progress_update.emit(f"Walking range calculated", base_progress + 35)
-        
-        # 创建等时圈GeoDataFrame（WGS84坐标系）
-        isochrone_gdf = gpd.GeoDataFrame(geometry=[isochrone_polygon])
-        isochrone_gdf.crs = G_proj.graph['crs']
-        
-        # 添加属性信息
-        isochrone_gdf['name'] = name
-        isochrone_gdf['lat'] = lat
-        isochrone_gdf['lng'] = lng
-        isochrone_gdf['distance'] = self.distance  # 步行范围
-        
-        # 保存为Shapefile格式
-        shp_dir = os.path.join(self.output_dir, "shapefiles")
-        if not os.path.exists(shp_dir):
-            os.makedirs(shp_dir)
-            self.progress_update.emit(f"Created Shapefile directory: {shp_dir}", base_progress + 40)
-        
-        # 转换为WGS84坐标系统(EPSG:4326)并保存为Shapefile
-        isochrone_wgs84 = isochrone_gdf.to_crs(epsg=4326)
-        shp_filename = os.path.join(shp_dir, f'{name_pinyin}_{self.distance}m_walking')
-        isochrone_wgs84.to_file(shp_filename, driver='ESRI Shapefile', encoding='utf-8')
-        self.progress_update.emit(f"Saved Shapefile: {shp_filename}.shp", base_progress + 45)
-        
-        # 步骤4: 可视化输出 - 生成地图并保存
-        self.progress_update.emit(f"Step 4/4: Generating map output...", base_progress + 50)
-        
-        # 转换为Web Mercator (EPSG:3857)用于绘图
-        isochrone_web_mercator = isochrone_gdf.to_crs(epsg=3857)
-        edges_web_mercator = edges.to_crs(epsg=3857)
-        origin_web_mercator = origin_gdf.to_crs(epsg=3857)
-        
-        # 创建图形和坐标轴
-        fig, ax = plt.subplots(1, 1, figsize=(10, 10), dpi=300)
-        
-        # 获取起始点坐标
-        center_x = origin_web_mercator.geometry.x[0]
-        center_y = origin_web_mercator.geometry.y[0]
-        
-        # 设置固定的视图范围 (4km x 4km)
-        half_width = 2000  # 2km半径，总共4km
-        ax.set_xlim([center_x - half_width, center_x + half_width])
-        ax.set_ylim([center_y - half_width, center_y + half_width])
-        
-        self.progress_update.emit(f"Setting up map canvas", base_progress + 60)
-        
-        # 添加底图 (OpenStreetMap)
-        cx.add_basemap(ax, source=cx.providers.OpenStreetMap.Mapnik, zoom=16)
-        
-        # 绘制路网
-        edges_web_mercator.plot(ax=ax, linewidth=0.7, color='gray', alpha=0.6, zorder=2)
-        
-        # 仅绘制等时圈轮廓 - 蓝色(#0000FF)，宽度1px，无填充
-        isochrone_web_mercator.boundary.plot(
-            ax=ax, 
-            color='#0000FF',  # 蓝色
-            linewidth=1,      # 1像素宽度
-            zorder=3          # 确保在路网上方显示
-        )
-        
-        # 绘制起始点
-        origin_web_mercator.plot(
-            ax=ax, 
-            color='red', 
-            marker='*', 
-            markersize=100, 
-            zorder=4
-        )
-        
-        self.progress_update.emit(f"Drawing map elements", base_progress + 70)
-        
-        # 添加比例尺
-        ax.add_artist(ScaleBar(
-            dx=1, 
-            location='lower right', 
-            box_alpha=0.5, 
-            color='black'
-        ))
-        
-        # 添加图例 - 使用英文标签
-        legend_elements = [
-            plt.Line2D([0], [0], color='#0000FF', lw=1, label=f'{self.distance}m Walking Range'),
-            plt.Line2D([0], [0], color='gray', lw=0.7, alpha=0.6, label='Walking Network'),
-            plt.Line2D([0], [0], color='red', marker='*', lw=0, markersize=10, label='Starting Point')
-        ]
-        ax.legend(handles=legend_elements, loc='lower left', framealpha=0.5)
-        
-        # 移除坐标轴
-        ax.set_axis_off()
-        
-        # 添加标题 - 使用英文标题
-        plt.title(f'{name_pinyin} - {self.distance}m Walking Isochrone', fontsize=14)
-        plt.tight_layout()
-        
-        self.progress_update.emit(f"Finalizing map", base_progress + 80)
-        
-        # 保存为PNG格式
-        output_filename = os.path.join(self.output_dir, f'{name_pinyin}_{self.distance}m_walking.png')
-        plt.savefig(output_filename, dpi=300, bbox_inches='tight', format='png')
-        plt.close()
+class RerenderWorker(QThread):
+    """用预览时保存的几何重绘出版质量的地图，不重新计算等时圈"""
+    progress_update = pyqtSignal(str, int)
+    finished = pyqtSignal(bool, str)
+    
+    def __init__(self, output_dir, offline_tiles=False):
+        super().__init__()
+        self.output_dir = output_dir
+        self.offline_tiles = offline_tiles
         
-        self.progress_update.emit(f"Saved map to: {output_filename}", base_progress + 85)
-        return output_filename
-            
-    def read_csv_file(self, file_path):
-        try:
-            # 尝试使用pandas读取，假设有标题行
-            df = pd.read_csv(file_path)
-            
-            # 检查是否包含必要的列
-            if 'name' in df.columns and 'latitude' in df.columns and 'longitude' in df.columns:
-                # 标准格式CSV
-                return df[['name', 'latitude', 'longitude']].to_dict('records')
-            else:
-                # 尝试只读取数据，不假设列名
-                coordinates = []
-                df = pd.read_csv(file_path, header=None)
-                
-                # 如果仅有3列，假设为name,lng,lat格式
-                if df.shape[1] == 3:
-                    for _, row in df.iterrows():
-                        coordinates.append({
-                            'name': str(row[0]),
-                            'longitude': float(row[1]),
-                            'latitude': float(row[2])
-                        })
-                else:
-                    # 直接尝试正则解析
-                    return self.parse_text_content(open(file_path, 'r', encoding='utf-8').read())
-                
-                return coordinates
-        except Exception as e:
-            self.progress_update.emit(f"CSV parsing error: {str(e)}, trying text format", 5)
-            # 如果CSV解析失败，回退到文本解析
-            return self.read_text_file(file_path)
-            
-    def read_text_file(self, file_path):
+    def run(self):
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-            return self.parse_text_content(content)
+            settings = IsochroneSettings(output_dir=self.output_dir,
+                                         basemap=TileCache(DEFAULT_TILE_DIR, offline=self.offline_tiles),
+                                         render_profile='publication')
+            outputs = rerender_cached(settings, self.progress_update.emit)
+            self.finished.emit(True, f"Rendered {len(outputs)} publication maps")
         except Exception as e:
-            raise Exception(f"Failed to read text file: {str(e)}")
-            
-    def read_excel_file(self, file_path):
-        try:
-            # 尝试使用pandas读取Excel
-            df = pd.read_excel(file_path)
-            
-            # 检查是否包含必要的列
-            if 'name' in df.columns and 'latitude' in df.columns and 'longitude' in df.columns:
-                # 标准格式
-                return df[['name', 'latitude', 'longitude']].to_dict('records')
-            else:
-                # 尝试解析内容
-                coordinates = []
-                
-                # 如果仅有3列，假设为name,lng,lat格式
-                if df.shape[1] == 3:
-                    for _, row in df.iterrows():
-                        try:
-                            coordinates.append({
-                                'name': str(row[0]),
-                                'longitude': float(row[1]),
-                                'latitude': float(row[2])
-                            })
-                        except:
-                            # 跳过无效行
-                            pass
-                
-                # 如果无法按上述方式解析，尝试从每一行文本中提取
-                if not coordinates:
-                    text_content = ""
-                    for _, row in df.iterrows():
-                        for col in df.columns:
-                            text_content += str(row[col]) + "\n"
-                    coordinates = self.parse_text_content(text_content)
-                
-                return coordinates
-        except Exception as e:
-            raise Exception(f"Failed to read Excel file: {str(e)}")
-            
-    def parse_text_content(self, content):
-        """从文本内容中解析坐标点"""
-        coordinates = []
-        lines = content.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # 使用正则表达式匹配格式: 名称 (经度, 纬度) 或类似变体
-            match = re.match(r'(.+?)\s*[\(\[\{]?\s*(\d+\.\d+)\s*,\s*(\d+\.\d+)\s*[\)\]\}]?', line)
-            if match:
-                name = match.group(1).strip()
-                lng = float(match.group(2))
-                lat = float(match.group(3))
-                coordinates.append({
-                    'name': name,
-                    'longitude': lng,
-                    'latitude': lat
-                })
-                continue
-                
-            # 尝试匹配Tab或逗号分隔的数据
-            parts = re.split(r'[\t,]+', line)
-            if len(parts) >= 3:
-                try:
-                    name = parts[0].strip()
-                    # 尝试不同位置组合找出经纬度
-                    for i in range(1, len(parts)-1):
-                        try:
-                            lng = float(parts[i])
-                            lat = float(parts[i+1])
-                            coordinates.append({
-                                'name': name,
-                                'longitude': lng,
-                                'latitude': lat
-                            })
-                            break
-                        except:
-                            continue
-                except:
-                    pass
-        
-        return coordinates
+            self.finished.emit(False, f"Error: {str(e)}")
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -457,6 +430,8 @@ class MainWindow(QMainWindow):
         self.input_file = ""
         self.output_dir = "isochrone_output"
         self.worker = None
+        # 会话内保留区域路网与各起始点的最短距离，只改变步行距离时无需重新计算
+        self.session_cache = SessionCache()
         
     def setup_file_tab(self):
         # 文件选项卡布局
@@ -492,6 +467,109 @@ class MainWindow(QMainWindow):
         self.distance_spin.setSuffix(" meters")
         form_layout.addRow("Walking Distance:", self.distance_spin)
         
+        # 多个步行距离：一次计算生成嵌套的等时圈环
+        self.rings_edit = QLineEdit()
+        self.rings_edit.setPlaceholderText("e.g. 500, 1000, 1500 (optional, overrides Walking Distance)")
+        form_layout.addRow("Distance Rings:", self.rings_edit)
+        
+        # 区域路网模式：邻近点共享一次下载的路网
+        self.regional_check = QCheckBox("Share one regional network for nearby points")
+        self.regional_check.setChecked(True)
+        form_layout.addRow("Network Mode:", self.regional_check)
+        
+        # 起始点定位方式：edge在最近的边上插入虚拟起始点，node定位到最近的节点
+        self.snap_combo = QComboBox()
+        self.snap_combo.addItems(list(SNAP_MODES))
+        form_layout.addRow("Origin Snapping:", self.snap_combo)
+        
+        # 边成本配置：distance按路网长度，walking/elderly按步行时间，steps对台阶加罚，hills按DEM坡度
+        self.profile_combo = QComboBox()
+        self.profile_combo.addItems(list(COST_PROFILES))
+        form_layout.addRow("Cost Profile:", self.profile_combo)
+        
+        # walking与hills配置的平路步速
+        self.walking_speed_spin = QDoubleSpinBox()
+        self.walking_speed_spin.setRange(1.0, 10.0)
+        self.walking_speed_spin.setSingleStep(0.1)
+        self.walking_speed_spin.setDecimals(1)
+        self.walking_speed_spin.setValue(WALKING_SPEED)
+        self.walking_speed_spin.setSuffix(" km/h")
+        form_layout.addRow("Walking Speed:", self.walking_speed_spin)
+        
+        # hills配置使用的DEM文件
+        self.dem_path = None
+        self.dem_path_label = QLabel("No DEM selected")
+        dem_select_btn = QPushButton("Select DEM")
+        dem_select_btn.clicked.connect(self.select_dem)
+        dem_layout = QHBoxLayout()
+        dem_layout.addWidget(self.dem_path_label)
+        dem_layout.addWidget(dem_select_btn)
+        form_layout.addRow("Elevation (hills):", dem_layout)
+        
+        # 合并相邻起始点：定位到同一位置的点总是只计算一次，此距离内的点也合并计算
+        self.merge_tolerance_spin = QSpinBox()
+        self.merge_tolerance_spin.setRange(0, 100)
+        self.merge_tolerance_spin.setValue(0)
+        self.merge_tolerance_spin.setSuffix(" meters")
+        self.merge_tolerance_spin.setSpecialValueText("Same position only")
+        form_layout.addRow("Merge Nearby Origins:", self.merge_tolerance_spin)
+        
+        # 路网磁盘缓存容量
+        self.cache_size_spin = QSpinBox()
+        self.cache_size_spin.setRange(0, 100000)
+        self.cache_size_spin.setValue(DEFAULT_CACHE_SIZE_MB)
+        self.cache_size_spin.setSingleStep(256)
+        self.cache_size_spin.setSuffix(" MB")
+        self.cache_size_spin.setSpecialValueText("Disabled")
+        form_layout.addRow("Network Cache:", self.cache_size_spin)
+        
+        # 并行进程数
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, max(os.cpu_count() or 1, 1))
+        self.workers_spin.setValue(1)
+        self.workers_spin.setSuffix(" processes")
+        form_layout.addRow("Parallel Workers:", self.workers_spin)
+        
+        # 等时圈多边形构建方法
+        self.method_combo = QComboBox()
+        self.method_combo.addItems(POLYGON_METHODS)
+        form_layout.addRow("Polygon Method:", self.method_combo)
+        
+        # 栅格方法的网格分辨率
+        self.raster_resolution_spin = QSpinBox()
+        self.raster_resolution_spin.setRange(1, 50)
+        self.raster_resolution_spin.setValue(5)
+        self.raster_resolution_spin.setSuffix(" meters")
+        form_layout.addRow("Raster Resolution:", self.raster_resolution_spin)
+        
+        # 底图瓦片缓存：离线模式下只使用本地瓦片
+        self.offline_tiles_check = QCheckBox("Offline (use cached tiles only)")
+        self.offline_tiles_check.setToolTip(f"Basemap tiles are cached in {DEFAULT_TILE_DIR}")
+        form_layout.addRow("Basemap Tiles:", self.offline_tiles_check)
+        
+        # 整体底图：为全部点一次性拼接底图，逐点只取切片
+        self.mosaic_check = QCheckBox("Stitch one basemap for all points")
+        form_layout.addRow("Basemap Mosaic:", self.mosaic_check)
+        
+        # 绘图配置：preview为低分辨率快速预览，之后可重绘为publication
+        self.render_profile_combo = QComboBox()
+        self.render_profile_combo.addItems(list(RENDER_PROFILES))
+        form_layout.addRow("Render Profile:", self.render_profile_combo)
+        
+        # 矢量输出：全部点写入一个图层，逐点Shapefile可选
+        vector_layout = QHBoxLayout()
+        self.vector_format_combo = QComboBox()
+        self.vector_format_combo.addItems(list(VECTOR_FORMATS) + ['none'])
+        vector_layout.addWidget(self.vector_format_combo)
+        self.shapefile_check = QCheckBox("Also write per-point shapefiles")
+        vector_layout.addWidget(self.shapefile_check)
+        form_layout.addRow("Vector Output:", vector_layout)
+        
+        # 断点续跑
+        self.resume_check = QCheckBox("Skip points already finished in the output directory")
+        self.resume_check.setChecked(True)
+        form_layout.addRow("Resume:", self.resume_check)
+        
         input_group.setLayout(form_layout)
         layout.addWidget(input_group)
         
@@ -500,6 +578,10 @@ class MainWindow(QMainWindow):
         self.start_btn = QPushButton("Generate Isochrones")
         self.start_btn.clicked.connect(self.start_analysis)
         btn_layout.addWidget(self.start_btn)
+        self.rerender_btn = QPushButton("Render Publication Maps")
+        self.rerender_btn.setToolTip("Re-render maps saved with the preview profile at publication quality")
+        self.rerender_btn.clicked.connect(self.start_rerender)
+        btn_layout.addWidget(self.rerender_btn)
         layout.addLayout(btn_layout)
         
         # 进度显示
@@ -591,6 +673,19 @@ class MainWindow(QMainWindow):
             self.input_file = file_path
             self.file_path_label.setText(os.path.basename(file_path))
     
+    def select_dem(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Select DEM File", "", "GeoTIFF Files (*.tif *.tiff)")
+        if file_path:
+            self.dem_path = file_path
+            self.dem_path_label.setText(os.path.basename(file_path))
+    
+    def check_dem(self):
+        """hills配置需要先选择DEM文件"""
+        if self.profile_combo.currentText() in ELEVATION_PROFILES and not self.dem_path:
+            QMessageBox.warning(self, "Warning", "Please select a DEM file for the hills cost profile!")
+            return False
+        return True
+    
     def select_output_dir(self):
         dir_path = QFileDialog.getExistingDirectory(self, "Select Output Directory")
         if dir_path:
@@ -604,30 +699,87 @@ class MainWindow(QMainWindow):
         if not self.input_file:
             QMessageBox.warning(self, "Warning", "Please select a coordinates file first!")
             return
+        if not self.check_dem():
+            return
             
         self.start_btn.setEnabled(False)
+        self.rerender_btn.setEnabled(False)
         self.log_text.clear()
         self.progress_bar.setValue(0)
         
         distance = self.distance_spin.value()
         
+        # 填写了多个步行距离时，一次生成多个等时圈环
+        rings = [int(d) for d in re.findall(r'\d+', self.rings_edit.text())]
+        if rings:
+            distance = rings
+        
         # 创建并启动工作线程
-        self.worker = IsochroneWorker(self.input_file, self.output_dir, distance)
+        self.worker = IsochroneWorker(self.input_file, self.output_dir, distance,
+                                      regional=self.regional_check.isChecked(),
+                                      cache_size_mb=self.cache_size_spin.value(),
+                                      workers=self.workers_spin.value(),
+                                      method=self.method_combo.currentText(),
+                                      raster_resolution=self.raster_resolution_spin.value(),
+                                      offline_tiles=self.offline_tiles_check.isChecked(),
+                                      basemap_mosaic=self.mosaic_check.isChecked(),
+                                      render_profile=self.render_profile_combo.currentText(),
+                                      vector_format=self.vector_format_combo.currentText(),
+                                      write_shapefile=self.shapefile_check.isChecked(),
+                                      resume=self.resume_check.isChecked(),
+                                      session_cache=self.session_cache,
+                                      merge_tolerance=self.merge_tolerance_spin.value(),
+                                      snap=self.snap_combo.currentText(),
+                                      profile=self.profile_combo.currentText(),
+                                      walking_speed=self.walking_speed_spin.value(),
+                                      dem_path=self.dem_path)
         self.worker.progress_update.connect(self.update_progress)
         self.worker.finished.connect(self.analysis_finished)
         self.worker.start()
         
     def start_map_based_analysis(self, points_data, output_dir, distance):
         """开始基于地图选点的等时圈生成"""
+        if not self.check_dem():
+            return
         # 切换到文件选项卡，以显示进度
         self.tabs.setCurrentWidget(self.file_tab)
         
         self.start_btn.setEnabled(False)
+        self.rerender_btn.setEnabled(False)
         self.log_text.clear()
         self.progress_bar.setValue(0)
         
         # 创建并启动工作线程
-        self.worker = IsochroneWorker(None, output_dir, distance, points_data)
+        self.worker = IsochroneWorker(None, output_dir, distance, points_data,
+                                      regional=self.regional_check.isChecked(),
+                                      cache_size_mb=self.cache_size_spin.value(),
+                                      workers=self.workers_spin.value(),
+                                      method=self.method_combo.currentText(),
+                                      raster_resolution=self.raster_resolution_spin.value(),
+                                      offline_tiles=self.offline_tiles_check.isChecked(),
+                                      basemap_mosaic=self.mosaic_check.isChecked(),
+                                      render_profile=self.render_profile_combo.currentText(),
+                                      vector_format=self.vector_format_combo.currentText(),
+                                      write_shapefile=self.shapefile_check.isChecked(),
+                                      resume=self.resume_check.isChecked(),
+                                      session_cache=self.session_cache,
+                                      merge_tolerance=self.merge_tolerance_spin.value(),
+                                      snap=self.snap_combo.currentText(),
+                                      profile=self.profile_combo.currentText(),
+                                      walking_speed=self.walking_speed_spin.value(),
+                                      dem_path=self.dem_path)
+        self.worker.progress_update.connect(self.update_progress)
+        self.worker.finished.connect(self.analysis_finished)
+        self.worker.start()
+        
+    def start_rerender(self):
+        """用预览时保存的几何重绘输出目录中的地图"""
+        self.start_btn.setEnabled(False)
+        self.rerender_btn.setEnabled(False)
+        self.log_text.clear()
+        self.progress_bar.setValue(0)
+        
+        self.worker = RerenderWorker(self.output_dir, offline_tiles=self.offline_tiles_check.isChecked())
         self.worker.progress_update.connect(self.update_progress)
         self.worker.finished.connect(self.analysis_finished)
         self.worker.start()
@@ -643,6 +795,12 @@ class MainWindow(QMainWindow):
         else:
             QMessageBox.critical(self, "Error", message)
         self.start_btn.setEnabled(True)
+        self.rerender_btn.setEnabled(True)
+        
+    def closeEvent(self, event):
+        # 删除会话缓存转存到磁盘的临时文件
+        self.session_cache.close()
+        super().closeEvent(event)
         
 if __name__ == "__main__":
     app = QApplication(sys.argv)
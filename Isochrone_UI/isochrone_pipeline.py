@@ -0,0 +1,239 @@
+"""
+单点等时圈处理流程
+
+- 由可达节点构建等时圈多边形、(可选)保存逐点Shapefile、绘制PNG地图
+- 定位到同一路网位置的多个坐标点只构建一次等时圈，再分别输出
+- 返回WGS84的等时圈表，由调用方批量写入单个矢量图层(见 vector_export)
+- 不依赖Qt，可在图形界面线程、命令行脚本或进程池的子进程中运行
+- 底图优先从本地瓦片缓存或整体底图切片读取(见 tile_cache)，地图由可重复使用的绘图器绘制(见 map_renderer)
+- 进程池模式下，区域路网数组写入临时目录，子进程以只读内存映射打开(见 routing.CSRGraph.open_shared)，多个子进程共用同一份路网
+- 预览模式下保存每个点的等时圈与路网几何，之后可直接重绘出版质量的地图，无需重新计算
+"""
+import copy
+import glob
+import os
+import pickle
+import re
+
+import geopandas as gpd
+from pypinyin import lazy_pinyin
+from shapely.geometry import Point
+
+from cost_profiles import WALKING_SPEED, profile_key
+from isochrone_polygon import build_isochrone_polygon
+from map_renderer import render_map, VIEW_HALF_WIDTH
+from routing import CSRGraph
+
+
+class IsochroneSettings:
+    """单点等时圈计算与输出的参数"""
+    def __init__(self, distances=(1000,), output_dir="isochrone_output", node_buffer=15, edge_buffer=10,
+                 simplify_tolerance=2, write_shapefile=False, png_suffix='walking',
+                 origin_label='Starting Point', method='buffer', concave_ratio=0.2, raster_resolution=5,
+                 basemap=None, render_profile='publication', snap='edge', profile='distance',
+                 walking_speed=WALKING_SPEED, dem_path=None, merge_tolerance=0):
+        self.distances = sorted(set(distances))
+        self.output_dir = output_dir
+        self.node_buffer = node_buffer  # 节点缓冲区(米)
+        self.edge_buffer = edge_buffer  # 边缓冲区(米)
+        self.simplify_tolerance = simplify_tolerance  # Douglas-Peucker简化公差(米)
+        self.method = method  # 多边形构建方法: buffer(缓冲合并) 或 concave(凹包)
+        self.concave_ratio = concave_ratio  # 凹包的凹度参数(0~1，越小越贴合路网)
+        self.raster_resolution = raster_resolution  # 栅格方法的网格分辨率(米)
+        self.write_shapefile = write_shapefile  # 是否为每个点单独保存Shapefile
+        self.png_suffix = png_suffix
+        self.origin_label = origin_label
+        self.basemap = basemap  # 底图来源(TileCache或BasemapMosaic)，为None时直接从contextily下载
+        self.render_profile = render_profile  # 绘图配置: publication(出版) 或 preview(预览)
+        self.snap = snap  # 起始点定位方式: edge(最近的边) 或 node(最近的节点)
+        self.profile = profile  # 边成本配置: distance、walking、elderly 或 steps
+        self.walking_speed = walking_speed  # walking与hills配置的平路步速(km/h)
+        self.dem_path = dem_path  # hills配置使用的DEM文件(GeoTIFF)
+        self.merge_tolerance = merge_tolerance  # 与组代表点相距不超过该距离(米)的起始点共用代表点的等时圈
+
+    def fingerprint(self):
+        """影响等时圈及输出结果的参数，用于断点续跑时判断点是否需要重新计算"""
+        return {
+            'distances': self.distances,
+            'node_buffer': self.node_buffer,
+            'edge_buffer': self.edge_buffer,
+            'simplify_tolerance': self.simplify_tolerance,
+            'method': self.method,
+            'concave_ratio': self.concave_ratio,
+            'raster_resolution': self.raster_resolution,
+            'write_shapefile': self.write_shapefile,
+            'png_suffix': self.png_suffix,
+            'origin_label': self.origin_label,
+            'render_profile': self.render_profile,
+            'snap': self.snap,
+            'profile': profile_key(self.profile, self.walking_speed, self.dem_path),
+            'merge_tolerance': self.merge_tolerance,
+        }
+
+    @property
+    def distance(self):
+        """最大步行距离，即最短路径计算的上限"""
+        return self.distances[-1]
+
+    @property
+    def distance_label(self):
+        return '-'.join(str(d) for d in self.distances)
+
+
+def to_pinyin(text):
+    """将中文文本转换为拼音"""
+    try:
+        # 先尝试使用pypinyin转拼音
+        pinyin = ''.join(lazy_pinyin(text))
+        # 如果结果为空或与原文相同，使用简单的替换方法
+        if not pinyin or pinyin == text:
+            # 移除非ASCII字符
+            ascii_text = re.sub(r'[^\x00-\x7F]+', '', text)
+            return ascii_text.strip() if ascii_text.strip() else "Station"
+        return pinyin
+    except:
+        # 出错时使用简单的替换方法
+        ascii_text = re.sub(r'[^\x00-\x7F]+', '', text)
+        return ascii_text.strip() if ascii_text.strip() else "Station"
+
+
+def build_rings(router, point, reach, reach_dist, settings):
+    """
+    由可达节点构建各步行距离的等时圈环
+
+    返回 (等时圈环列表, 最大距离内的可达边几何)，坐标系为路网坐标系。
+    """
+    # 创建起始点并投影到路网坐标系(没有可达点时以起始点为中心生成小范围等时圈)
+    origin_gdf = gpd.GeoDataFrame(geometry=[Point(point['longitude'], point['latitude'])], crs="EPSG:4326")
+    origin_proj = origin_gdf.to_crs(router.crs)
+
+    # 按距离从小到大生成嵌套的等时圈环
+    rings = [build_isochrone_polygon(router, reach, reach_dist, distance, origin_proj, settings)
+             for distance in settings.distances]
+
+    # 最大距离内的可达边几何，用于绘制路网
+    edge_geoms = router.reachable_edge_geometries(reach)
+    return rings, edge_geoms
+
+
+def write_point_outputs(point, rings, edge_geoms, crs, settings, progress):
+    """为单个坐标点输出等时圈(可选Shapefile)及PNG地图，返回 (PNG文件路径, WGS84等时圈表)"""
+    name, name_pinyin = point['name'], point['name_pinyin']
+    lat, lng = point['latitude'], point['longitude']
+    origin_gdf = gpd.GeoDataFrame(geometry=[Point(lng, lat)], crs="EPSG:4326")
+
+    # 创建等时圈GeoDataFrame，每个步行距离一行
+    isochrone_gdf = gpd.GeoDataFrame(geometry=rings)
+    isochrone_gdf.crs = crs
+
+    # 添加属性信息
+    isochrone_gdf['name'] = name
+    isochrone_gdf['lat'] = lat
+    isochrone_gdf['lng'] = lng
+    isochrone_gdf['distance'] = settings.distances  # 步行范围
+
+    # 转换为WGS84坐标系统(EPSG:4326)，用于矢量输出
+    isochrone_wgs84 = isochrone_gdf.to_crs(epsg=4326)
+
+    if settings.write_shapefile:
+        # 保存为Shapefile格式
+        shp_dir = os.path.join(settings.output_dir, "shapefiles")
+        os.makedirs(shp_dir, exist_ok=True)
+        shp_filename = os.path.join(shp_dir, f'{name_pinyin}_{settings.distance_label}m_walking')
+        isochrone_wgs84.to_file(shp_filename, driver='ESRI Shapefile', encoding='utf-8')
+        progress(f"Saved Shapefile: {shp_filename}.shp", 50)
+
+    # 步骤4: 可视化输出 - 生成地图并保存
+    progress("Step 4/4: Generating map output...", 55)
+    output_filename = render_map(isochrone_gdf, edge_geoms, origin_gdf, name_pinyin, settings)
+    if settings.render_profile == 'preview':
+        # 保存绘图所需的几何，之后可重绘出版质量的地图
+        save_render_geometries(point, rings, edge_geoms, crs, settings)
+    progress(f"Saved map to: {output_filename}", 100)
+    return output_filename, isochrone_wgs84
+
+
+def process_points(router, points, reach, reach_dist, settings, progress=None):
+    """
+    为定位到同一起始节点的一组坐标点生成等时圈并分别输出结果
+
+    router为区域的CSR数组路网，reach/reach_dist为该起始节点在最大距离内的可达节点下标及距离，
+    等时圈环只由组内第一个点构建一次，再为每个点各自输出矢量表和地图(标题、文件名、起始点不同)。
+    points为包含name、name_pinyin、latitude、longitude的字典列表。
+    progress(message, percent)用于报告处理进度。
+    返回每个点的 (PNG文件路径, WGS84等时圈表)，等时圈表每个步行距离一行，字段为name、lat、lng、distance。
+    """
+    progress = progress or (lambda message, percent: None)
+    rings, edge_geoms = build_rings(router, points[0], reach, reach_dist, settings)
+    progress("Walking range calculated", 40)
+    return [write_point_outputs(point, rings, edge_geoms, router.crs, settings, progress) for point in points]
+
+
+# 预览模式下保存绘图几何的子目录
+RENDER_CACHE_DIR = 'render_cache'
+
+
+def save_render_geometries(point, rings, edge_geoms, crs, settings):
+    """保存单个点的等时圈环、可达边几何及起始点信息，返回文件路径"""
+    cache_dir = os.path.join(settings.output_dir, RENDER_CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{point['name_pinyin']}_{settings.distance_label}m.pkl")
+    data = {
+        'point': point,
+        'distances': settings.distances,
+        'crs': crs,
+        'rings': rings,
+        'edges': edge_geoms,
+    }
+    with open(path, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def rerender_cached(settings, progress=None):
+    """
+    用预览时保存的几何重绘输出目录中的全部地图(按settings的绘图配置，通常为publication)
+
+    不重新下载路网或计算等时圈。progress(message, percent)报告进度。返回PNG文件路径列表。
+    """
+    progress = progress or (lambda message, percent: None)
+    paths = sorted(glob.glob(os.path.join(settings.output_dir, RENDER_CACHE_DIR, '*.pkl')))
+    if not paths:
+        raise Exception(f"No cached geometries found in {os.path.join(settings.output_dir, RENDER_CACHE_DIR)}")
+    outputs = []
+    for number, path in enumerate(paths, 1):
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        point = data['point']
+        # 按缓存时的步行距离绘制
+        point_settings = copy.copy(settings)
+        point_settings.distances = data['distances']
+        isochrone_gdf = gpd.GeoDataFrame(geometry=data['rings'], crs=data['crs'])
+        origin_gdf = gpd.GeoDataFrame(geometry=[Point(point['longitude'], point['latitude'])], crs="EPSG:4326")
+        output_filename = render_map(isochrone_gdf, data['edges'], origin_gdf, point['name_pinyin'], point_settings)
+        outputs.append(output_filename)
+        progress(f"Saved map to: {output_filename}", int(number * 100 / len(paths)))
+    return outputs
+
+
+# 进程池子进程中已打开的区域路网 {目录路径: CSRGraph}
+_loaded_routers = {}
+
+
+def save_router(router, path):
+    """将区域CSR路网数组写入临时目录，供进程池子进程内存映射打开"""
+    return router.save_shared(path)
+
+
+def load_router(path):
+    """在子进程中以只读内存映射打开区域CSR路网，同一区域只打开一次"""
+    if path not in _loaded_routers:
+        # 只保留当前区域的映射，之前区域的文件映射随之释放
+        _loaded_routers.clear()
+        _loaded_routers[path] = CSRGraph.open_shared(path)
+    return _loaded_routers[path]
+
+
+def process_points_task(router_path, points, reach, reach_dist, settings):
+    """进程池任务：在子进程中处理共用同一起始节点的一组坐标点"""
+    return process_points(load_router(router_path), points, reach, reach_dist, settings)
@@ -0,0 +1,176 @@
+"""
+等时圈多边形构建模块
+
+- buffer: 对可达节点和可达边做缓冲后合并(原有方法，结果最精细)
+- concave: 对可达节点、可达边折点和边上的截断点求凹包，避免合并成千上万个缓冲区
+- raster: 将可达边栅格化到NumPy网格，形态学闭运算后追踪等值线，耗时只与可达边总长度有关
+"""
+import contourpy
+import numpy as np
+import shapely
+from scipy import ndimage
+from shapely.geometry import Polygon
+
+# 可选的多边形构建方法
+POLYGON_METHODS = ('buffer', 'concave', 'raster')
+
+
+def reachable_distances(router, reach, reach_dist):
+    """将可达节点的距离展开为全部节点的距离数组，不可达节点为inf"""
+    dist = np.full(router.n_nodes, np.inf, dtype=np.float32)
+    dist[reach] = reach_dist
+    return dist
+
+
+def edge_cut_points(router, dist, distance):
+    """
+    计算从可达节点出发、在distance处被截断的边上的截断点
+
+    起点可达而终点超出距离的边，按剩余距离在边几何上插值得到截断点。
+    """
+    d_u = dist[router.edge_u]
+    d_v = dist[router.edge_v]
+    remaining = distance - d_u
+    partial = (remaining >= 0) & (d_v > distance) & (remaining < router.edge_costs)
+    if not partial.any():
+        return np.empty((0, 2))
+    geoms = router.edge_geometries(partial)
+    # 按边成本与几何长度的比例换算插值位置
+    along = remaining[partial] / router.edge_costs[partial] * shapely.length(geoms)
+    return shapely.get_coordinates(shapely.line_interpolate_point(geoms, along))
+
+
+def buffer_outline(router, reach, settings):
+    """缓冲合并方法：对节点和完整边几何做向量化缓冲后整体合并"""
+    # 提取可达节点坐标和两端均可达的边(使用完整的边几何，保留弯曲路段)
+    node_points = shapely.points(router.x[reach], router.y[reach])
+    edge_geoms = router.reachable_edge_geometries(reach)
+
+    # 对节点和边整体做向量化缓冲，不逐行构建Python对象
+    node_buffers = shapely.buffer(node_points, settings.node_buffer)  # 节点缓冲区
+    edge_buffers = shapely.buffer(edge_geoms, settings.edge_buffer)   # 边缓冲区
+
+    # 合并所有缓冲区创建初始等时圈
+    buffers = np.concatenate([node_buffers, edge_buffers])
+    if not len(buffers):
+        return None
+    return shapely.union_all(buffers)
+
+
+def concave_outline(router, reach, reach_dist, distance, settings):
+    """凹包方法：对可达节点、可达边折点及边截断点求凹包，再外扩边缓冲距离"""
+    edge_geoms = router.reachable_edge_geometries(reach)
+    dist = reachable_distances(router, reach, reach_dist)
+    coords = np.vstack([
+        np.column_stack([router.x[reach], router.y[reach]]),
+        shapely.get_coordinates(edge_geoms),
+        edge_cut_points(router, dist, distance),
+    ])
+    if len(coords) < 3:
+        return None
+    hull = shapely.concave_hull(shapely.multipoints(coords), ratio=settings.concave_ratio)
+    return hull.buffer(settings.edge_buffer)
+
+
+def partial_edge_points(router, dist, distance, spacing):
+    """
+    起点可达而终点超出距离的边，按spacing加密后保留剩余距离以内的折点
+
+    返回折点坐标数组，与 edge_cut_points 一样按边成本与几何长度的比例换算。
+    """
+    d_u = dist[router.edge_u]
+    remaining = distance - d_u
+    partial = (remaining >= 0) & (dist[router.edge_v] > distance) & (remaining < router.edge_costs)
+    if not partial.any():
+        return np.empty((0, 2))
+    geoms = router.edge_geometries(partial)
+    scale = shapely.length(geoms) / np.maximum(router.edge_costs[partial], 1e-9)
+    coords, index = shapely.get_coordinates(shapely.segmentize(geoms, spacing), return_index=True)
+    along = shapely.line_locate_point(geoms[index], shapely.points(coords))
+    return coords[along <= remaining[partial][index] * scale[index]]
+
+
+def disk(radius):
+    """半径为radius个栅格的圆形结构元素"""
+    r = max(int(np.ceil(radius)), 1)
+    yy, xx = np.mgrid[-r:r + 1, -r:r + 1]
+    return xx ** 2 + yy ** 2 <= radius ** 2 + 1e-9
+
+
+def raster_outline(router, reach, reach_dist, distance, settings):
+    """
+    栅格方法：将可达边(含截断的部分边)按栅格分辨率加密为点后写入占用网格，
+    膨胀边缓冲距离并做闭运算、填充空洞，最后追踪0.5等值线得到多边形
+    """
+    resolution = settings.raster_resolution
+    edge_geoms = router.reachable_edge_geometries(reach)
+    dist = reachable_distances(router, reach, reach_dist)
+    coords = np.vstack([
+        np.column_stack([router.x[reach], router.y[reach]]),
+        shapely.get_coordinates(shapely.segmentize(edge_geoms, resolution / 2)),
+        partial_edge_points(router, dist, distance, resolution / 2),
+    ])
+    if not len(coords):
+        return None
+
+    # 网格四周预留膨胀、闭运算所需的空白，保证等值线闭合
+    dilate = max(settings.edge_buffer / resolution, 1)
+    close = max(settings.node_buffer / resolution, 1)
+    pad = int(np.ceil(dilate + close)) + 2
+    x0, y0 = coords.min(axis=0) - pad * resolution
+    cols = ((coords[:, 0] - x0) / resolution).astype(np.int64)
+    rows = ((coords[:, 1] - y0) / resolution).astype(np.int64)
+    grid = np.zeros((rows.max() + pad + 1, cols.max() + pad + 1), dtype=bool)
+    grid[rows, cols] = True
+
+    # 形态学处理：膨胀为边缓冲宽度，闭运算连接相邻街道，填充内部空洞
+    grid = ndimage.binary_dilation(grid, structure=disk(dilate))
+    grid = ndimage.binary_closing(grid, structure=disk(close))
+    grid = ndimage.binary_fill_holes(grid)
+
+    # 在栅格中心坐标上追踪0.5等值线
+    xs = x0 + (np.arange(grid.shape[1]) + 0.5) * resolution
+    ys = y0 + (np.arange(grid.shape[0]) + 0.5) * resolution
+    lines = contourpy.contour_generator(xs, ys, grid.astype(np.float32)).lines(0.5)
+    polygons = [Polygon(line) for line in lines if len(line) >= 4]
+    if not polygons:
+        return None
+    return shapely.union_all(shapely.make_valid(np.array(polygons, dtype=object)))
+
+
+def build_isochrone_polygon(router, reach, reach_dist, distance, origin_proj, settings):
+    """
+    由最大距离内的可达节点(数组下标)及距离构建distance处的等时圈多边形
+
+    settings.method 选择构建方法('buffer'、'concave' 或 'raster')。
+    """
+    within = reach_dist <= distance
+    if settings.method == 'concave':
+        isochrone_polygon = concave_outline(router, reach[within], reach_dist[within], distance, settings)
+    elif settings.method == 'raster':
+        isochrone_polygon = raster_outline(router, reach[within], reach_dist[within], distance, settings)
+    elif settings.method == 'buffer':
+        isochrone_polygon = buffer_outline(router, reach[within], settings)
+    else:
+        raise ValueError(f"Unknown polygon method: {settings.method}")
+
+    if isochrone_polygon is None or isochrone_polygon.is_empty:
+        # 如果没有可达点，创建一个小范围圆形作为等时圈
+        return origin_proj.geometry[0].buffer(50)
+
+    # 平滑处理
+    isochrone_polygon = isochrone_polygon.buffer(10).buffer(-5)
+
+    # 应用Douglas-Peucker简化算法
+    isochrone_polygon = isochrone_polygon.simplify(settings.simplify_tolerance, preserve_topology=True)
+
+    # 移除等时圈内部的空洞，确保是一个完整的多边形
+    if hasattr(isochrone_polygon, 'geoms'):
+        # 处理MultiPolygon情况：取面积最大的多边形
+        largest_polygon = max(isochrone_polygon.geoms, key=lambda p: p.area)
+        # 仅保留外部环，去除内部孔洞
+        isochrone_polygon = Polygon(largest_polygon.exterior)
+    else:
+        # 处理单个Polygon情况：直接去除内部孔洞
+        isochrone_polygon = Polygon(isochrone_polygon.exterior)
+    return isochrone_polygon
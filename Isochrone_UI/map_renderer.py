@@ -0,0 +1,197 @@
+"""
+等时圈地图绘制模块
+
+- 图形、坐标轴、比例尺、图例等静态元素只创建一次，逐点只替换底图图像、路网、等时圈轮廓和起始点
+- 直接使用Agg画布，不经过pyplot的全局状态
+- 每个线程(及进程池的每个子进程)各自持有绘图器，可并行绘图
+- 输出裁切范围在创建时计算一次，保存时不再做 bbox_inches='tight' 的额外布局
+- 绘图配置: publication(300dpi、16级底图、绘制路网) 与 preview(低分辨率、粗底图、不绘制路网)
+"""
+import os
+import threading
+
+import contextily as cx
+import geopandas as gpd
+import matplotlib as mpl
+import numpy as np
+import shapely
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from matplotlib.transforms import Bbox
+from matplotlib_scalebar.scalebar import ScaleBar
+
+from tile_cache import DEFAULT_PROVIDER, DEFAULT_ZOOM
+
+# Force matplotlib to use English fonts
+mpl.rcParams['font.family'] = ['DejaVu Sans', 'Arial', 'Helvetica', 'sans-serif']
+mpl.rcParams['axes.unicode_minus'] = False
+
+# 地图视图半宽(米)，即以起始点为中心的4km x 4km范围
+VIEW_HALF_WIDTH = 2000
+
+# 多个步行距离(等时圈环)的轮廓颜色，第一个为默认的蓝色
+RING_COLORS = ['#0000FF', '#FF8C00', '#008000', '#8B008B', '#00CED1', '#B22222']
+
+# 绘图配置：输出分辨率、底图缩放级别、是否绘制路网
+RENDER_PROFILES = {
+    'publication': {'dpi': 300, 'zoom': DEFAULT_ZOOM, 'edges': True},
+    'preview': {'dpi': 100, 'zoom': 14, 'edges': False},
+}
+
+
+def line_segments(geoms):
+    """将线/面边界几何数组转换为 LineCollection 所需的坐标数组列表"""
+    coords, index = shapely.get_coordinates(geoms, return_index=True)
+    if not len(coords):
+        return []
+    splits = np.flatnonzero(np.diff(index)) + 1
+    return np.split(coords, splits)
+
+
+class MapRenderer:
+    """可重复使用的等时圈地图绘图器，同一组步行距离、图例与绘图配置只创建一次图形"""
+    def __init__(self, distances, origin_label, profile='publication'):
+        self.ring_colors = [RING_COLORS[i % len(RING_COLORS)] for i in range(len(distances))]
+        self.dpi = RENDER_PROFILES[profile]['dpi']
+        self.zoom = RENDER_PROFILES[profile]['zoom']
+        self.draw_edges = RENDER_PROFILES[profile]['edges']
+
+        # 创建图形和坐标轴(不使用pyplot)
+        self.fig = Figure(figsize=(10, 10), dpi=self.dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot(1, 1, 1)
+        ax = self.ax
+        ax.set_aspect('equal')
+
+        # 底图占位图像，逐点替换图像数据和范围
+        self.basemap = ax.imshow(np.zeros((1, 1, 4), dtype=np.uint8), extent=(0, 1, 0, 1),
+                                 interpolation='bilinear', zorder=1)
+
+        # 路网、等时圈轮廓、起始点
+        self.edges = ax.add_collection(LineCollection([], linewidths=0.7, colors='gray', alpha=0.6, zorder=2))
+        self.edges.set_visible(self.draw_edges)
+        self.rings = ax.add_collection(LineCollection([], linewidths=1, zorder=3))
+        self.origin = ax.scatter([0], [0], s=100, c='red', marker='*', zorder=4)
+
+        # 添加比例尺
+        ax.add_artist(ScaleBar(
+            dx=1,
+            location='lower right',
+            box_alpha=0.5,
+            color='black'
+        ))
+
+        # 添加图例 - 使用英文标签
+        legend_elements = [
+            Line2D([0], [0], color=color, lw=1, label=f'{distance}m Walking Range')
+            for distance, color in zip(distances, self.ring_colors)
+        ] + ([
+            Line2D([0], [0], color='gray', lw=0.7, alpha=0.6, label='Walking Network')
+        ] if self.draw_edges else []) + [
+            Line2D([0], [0], color='red', marker='*', lw=0, markersize=10, label=origin_label)
+        ]
+        ax.legend(handles=legend_elements, loc='lower left', framealpha=0.5)
+
+        # 底图版权信息，逐点更新文字
+        self.attribution = cx.add_attribution(ax, '')
+
+        # 移除坐标轴
+        ax.set_axis_off()
+
+        # 标题与布局：用占位标题完成一次布局，并确定输出的裁切范围
+        # 标题位置固定在坐标轴上方(不随文字自动调整)，逐点替换文字后可直接计算其范围
+        self.title = ax.set_title('Station - 1000m Walking Isochrone', fontsize=14, y=1.0)
+        self.set_view(0, 0)
+        self.fig.tight_layout()
+        self.canvas.draw()
+        self.bbox = self.fig.get_tightbbox(self.canvas.get_renderer()).padded(0.1)
+
+    def set_view(self, center_x, center_y):
+        """设置固定的视图范围 (4km x 4km)"""
+        self.ax.set_xlim(center_x - VIEW_HALF_WIDTH, center_x + VIEW_HALF_WIDTH)
+        self.ax.set_ylim(center_y - VIEW_HALF_WIDTH, center_y + VIEW_HALF_WIDTH)
+
+    def render(self, isochrone_gdf, edge_geoms, origin_gdf, name_pinyin, settings):
+        """
+        绘制等时圈地图并保存为PNG
+
+        isochrone_gdf每个步行距离一行，edge_geoms为与其同一坐标系的路网边几何数组。返回PNG文件路径。
+        """
+        # 转换为Web Mercator (EPSG:3857)用于绘图
+        isochrone_web_mercator = isochrone_gdf.geometry.to_crs(epsg=3857)
+        origin_web_mercator = origin_gdf.to_crs(epsg=3857)
+
+        # 获取起始点坐标
+        center_x = origin_web_mercator.geometry.x[0]
+        center_y = origin_web_mercator.geometry.y[0]
+        self.set_view(center_x, center_y)
+        xmin, xmax = center_x - VIEW_HALF_WIDTH, center_x + VIEW_HALF_WIDTH
+        ymin, ymax = center_y - VIEW_HALF_WIDTH, center_y + VIEW_HALF_WIDTH
+
+        # 替换底图 (OpenStreetMap)，优先读取本地瓦片缓存或整体底图
+        if settings.basemap is not None:
+            img, extent = settings.basemap.basemap_image(xmin, xmax, ymin, ymax, self.zoom)
+            attribution = settings.basemap.attribution
+        else:
+            img, extent = cx.bounds2img(xmin, ymin, xmax, ymax, zoom=self.zoom, source=DEFAULT_PROVIDER)
+            attribution = DEFAULT_PROVIDER.get('attribution', '')
+        self.basemap.set_data(img)
+        self.basemap.set_extent(extent)
+        self.attribution.set_text(attribution)
+        self.set_view(center_x, center_y)
+
+        # 替换路网(预览配置不绘制路网)
+        if self.draw_edges:
+            edges_web_mercator = gpd.GeoSeries(edge_geoms, crs=isochrone_gdf.crs).to_crs(epsg=3857)
+            self.edges.set_segments(line_segments(edges_web_mercator.to_numpy()))
+
+        # 仅绘制等时圈轮廓 - 第一个环为蓝色(#0000FF)，宽度1px，无填充，每个环一种颜色
+        boundaries = shapely.boundary(isochrone_web_mercator.to_numpy())
+        segments, colors = [], []
+        for boundary, color in zip(boundaries, self.ring_colors):
+            parts = line_segments(np.array([boundary], dtype=object))
+            segments.extend(parts)
+            colors.extend([color] * len(parts))
+        self.rings.set_segments(segments)
+        self.rings.set_color(colors)
+
+        # 起始点
+        self.origin.set_offsets([[center_x, center_y]])
+
+        # 添加标题 - 使用英文标题
+        self.title.set_text(f'{name_pinyin} - {settings.distance_label}m Walking Isochrone')
+
+        # 站名较长、标题超出固定的裁切范围时扩大裁切范围(只计算标题文字的范围，不重新布局)
+        bbox = self.bbox
+        title_bbox = self.title.get_window_extent(self.canvas.get_renderer()).transformed(
+            self.fig.dpi_scale_trans.inverted()).padded(0.1)
+        if title_bbox.x0 < bbox.x0 or title_bbox.x1 > bbox.x1 or title_bbox.y1 > bbox.y1:
+            bbox = Bbox.union([bbox, title_bbox])
+
+        # 保存为PNG格式
+        output_filename = os.path.join(settings.output_dir,
+                                       f'{name_pinyin}_{settings.distance_label}m_{settings.png_suffix}.png')
+        self.fig.savefig(output_filename, dpi=self.dpi, bbox_inches=bbox, format='png')
+        return output_filename
+
+
+# 每个线程各自的绘图器 {(步行距离, 起始点图例, 绘图配置): MapRenderer}
+_local = threading.local()
+
+
+def get_renderer(settings):
+    """取得当前线程中与settings的图例一致的绘图器，不存在时创建"""
+    key = (tuple(settings.distances), settings.origin_label, settings.render_profile)
+    renderers = _local.__dict__.setdefault('renderers', {})
+    if key not in renderers:
+        # 只保留最近使用的一个绘图器，避免图形对象累积
+        renderers.clear()
+        renderers[key] = MapRenderer(settings.distances, settings.origin_label, settings.render_profile)
+    return renderers[key]
+
+
+def render_map(isochrone_gdf, edge_geoms, origin_gdf, name_pinyin, settings):
+    """绘制等时圈地图并保存为PNG，返回PNG文件路径"""
+    return get_renderer(settings).render(isochrone_gdf, edge_geoms, origin_gdf, name_pinyin, settings)
@@ -0,0 +1,235 @@
+"""
+区域路网模块
+
+- 将一批起始点按空间邻近关系分组
+- 每组只下载并投影一次区域路网，转换为紧凑数组路网(routing.CSRGraph)后供组内所有起始点复用，NetworkX路网随即释放
+- 孤立的起始点仍按单点方式下载路网
+- 下载范围由步行距离加绕行余量确定；最短路径到达路网边界时，只为到达边界的起始点扩大范围重新下载
+"""
+import math
+
+import numpy as np
+import osmnx as ox
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+from shapely.geometry import box
+
+from routing import CSRGraph
+
+# 地球半径(米)，用于经纬度与米之间的近似换算
+EARTH_RADIUS = 6371008.8
+
+# 下载范围相对步行距离的余量(与会话缓存的搜索半径余量一致，调大步行距离时可复用路网与最短距离)
+DETOUR_MARGIN = 0.2
+
+# 下载范围的附加距离(米)：起始点到路网的定位距离及等时圈多边形的缓冲区
+FETCH_PADDING = 300
+
+# 可达节点距下载范围边缘小于该距离(米)时视为到达路网边界
+BOUNDARY_BAND = 100
+
+# 到达边界时下载范围的扩大倍数及最多扩大次数
+EXPANSION_FACTOR = 1.5
+MAX_EXPANSIONS = 2
+
+
+def fetch_radius(distance, reach_factor=1.0, margin=DETOUR_MARGIN):
+    """
+    由最大步行距离计算路网下载半径(米)
+
+    reach_factor为每米成本最多对应的实际距离(见 cost_profiles.reach_factor)，时间类配置下步速较快时范围更大。
+    """
+    return distance * reach_factor * (1 + margin) + FETCH_PADDING
+
+
+def approx_meters(lats, lngs, lat0=None):
+    """将经纬度近似转换为以米为单位的平面坐标(等距圆柱投影)"""
+    lats = np.asarray(lats, dtype=float)
+    lngs = np.asarray(lngs, dtype=float)
+    if lat0 is None:
+        lat0 = float(np.mean(lats)) if len(lats) else 0.0
+    x = np.radians(lngs) * EARTH_RADIUS * math.cos(math.radians(lat0))
+    y = np.radians(lats) * EARTH_RADIUS
+    return x, y
+
+
+def meters_to_degrees(meters, lat):
+    """将米换算为(纬度差, 经度差)"""
+    dlat = math.degrees(meters / EARTH_RADIUS)
+    dlng = math.degrees(meters / (EARTH_RADIUS * max(math.cos(math.radians(lat)), 1e-6)))
+    return dlat, dlng
+
+
+class GraphRegion:
+    """一组共享同一路网的起始点"""
+    def __init__(self, indices, lats, lngs, fetch_distance, expansions=0):
+        self.indices = [int(i) for i in indices]
+        self.fetch_distance = fetch_distance
+        self.expansions = expansions  # 因到达路网边界而扩大下载范围的次数
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        self.center = (float(lats.mean()), float(lngs.mean()))
+        if len(self.indices) == 1:
+            # 孤立点：沿用单点下载方式
+            self.bounds = None
+        else:
+            # 区域包络：所有点的外包矩形向外扩展下载半径
+            dlat, dlng = meters_to_degrees(fetch_distance, float(np.abs(lats).max()))
+            self.bounds = (float(lngs.min()) - dlng, float(lats.min()) - dlat,
+                           float(lngs.max()) + dlng, float(lats.max()) + dlat)
+
+    @property
+    def is_regional(self):
+        return self.bounds is not None
+
+    @property
+    def extent(self):
+        """区域覆盖范围(west, south, east, north)，单点为其下载半径的外包矩形"""
+        if self.is_regional:
+            return self.bounds
+        lat, lng = self.center
+        dlat, dlng = meters_to_degrees(self.fetch_distance, lat)
+        return (lng - dlng, lat - dlat, lng + dlng, lat + dlat)
+
+    def boundary_mask(self, lngs, lats, band=BOUNDARY_BAND):
+        """经纬度数组中距下载范围边缘不足band(米)的位置"""
+        west, south, east, north = self.extent
+        dlat, dlng = meters_to_degrees(band, max(abs(south), abs(north)))
+        lngs = np.asarray(lngs)
+        lats = np.asarray(lats)
+        return (lngs < west + dlng) | (lngs > east - dlng) | (lats < south + dlat) | (lats > north - dlat)
+
+    def __str__(self):
+        if self.is_regional:
+            west, south, east, north = self.bounds
+            return (f"region of {len(self.indices)} points "
+                    f"({south:.4f}, {west:.4f}, {north:.4f}, {east:.4f})")
+        return f"single point ({self.center[0]:.6f}, {self.center[1]:.6f})"
+
+
+def boundary_reaches(region, router, reaches, band=BOUNDARY_BAND):
+    """
+    最短路径到达路网边界的起点序号列表
+
+    reaches为各起点的 (可达节点下标, 距离)，可达节点中有距区域下载范围边缘不足band(米)的节点时，
+    该起点的等时圈可能被路网范围截断。
+    """
+    touching = region.boundary_mask(*router.node_lnglat(), band)
+    return [i for i, (reach, _) in enumerate(reaches) if touching[reach].any()]
+
+
+def plan_regions(lats, lngs, fetch_distance=fetch_radius(1000), regional=True, max_region_size=20000):
+    """
+    将起始点划分为若干路网区域
+
+    相互距离不超过下载半径的点(单链接聚类)归入同一区域；
+    区域跨度超过 max_region_size(米) 时再按网格切分，避免下载过大的路网。
+    """
+    lats = np.asarray(lats, dtype=float)
+    lngs = np.asarray(lngs, dtype=float)
+    n = len(lats)
+    if n == 0:
+        return []
+    if not regional or n == 1:
+        return [GraphRegion([i], lats[[i]], lngs[[i]], fetch_distance) for i in range(n)]
+
+    x, y = approx_meters(lats, lngs)
+
+    # 单链接聚类：两点下载范围相互重叠即视为相邻
+    pairs = cKDTree(np.column_stack([x, y])).query_pairs(r=fetch_distance, output_type='ndarray')
+    adjacency = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n, n)) \
+        if len(pairs) else coo_matrix((n, n))
+    n_clusters, labels = connected_components(adjacency, directed=False)
+
+    regions = []
+    for label in range(n_clusters):
+        members = np.flatnonzero(labels == label)
+        cx, cy = x[members], y[members]
+        if (cx.max() - cx.min()) <= max_region_size and (cy.max() - cy.min()) <= max_region_size:
+            tiles = [members]
+        else:
+            # 区域过大时按网格切分
+            col = np.floor((cx - cx.min()) / max_region_size).astype(int)
+            row = np.floor((cy - cy.min()) / max_region_size).astype(int)
+            tile_ids = row * (col.max() + 1) + col
+            tiles = [members[tile_ids == t] for t in np.unique(tile_ids)]
+        for tile in tiles:
+            regions.append(GraphRegion(tile, lats[tile], lngs[tile], fetch_distance))
+    return regions
+
+
+def prepare_graph(G):
+    """投影路网(边成本在转换为CSR数组时按配置计算，见 routing.CSRGraph)"""
+    # 将地理坐标投影到平面坐标系统(UTM)以便进行距离计算
+    return ox.project_graph(G)
+
+
+def download_graph(region, network_type='all'):
+    """下载区域对应的路网"""
+    if region.is_regional:
+        return ox.graph_from_polygon(box(*region.bounds), network_type=network_type)
+    return ox.graph_from_point(region.center, dist=region.fetch_distance, network_type=network_type)
+
+
+class RegionalGraphProvider:
+    """为一批坐标点提供紧凑数组路网，区域内的点共享同一个路网"""
+    def __init__(self, coordinates, fetch_distance=fetch_radius(1000), network_type='all', regional=True,
+                 max_region_size=20000, cache=None):
+        self.coordinates = coordinates
+        self.fetch_distance = fetch_distance
+        self.network_type = network_type
+        self.cache = cache  # GraphCache，为None时不使用磁盘缓存
+        self.regions = plan_regions([c['latitude'] for c in coordinates],
+                                    [c['longitude'] for c in coordinates],
+                                    fetch_distance=fetch_distance, regional=regional,
+                                    max_region_size=max_region_size)
+
+    def expand(self, region, positions, factor=EXPANSION_FACTOR, fetch_distance=None):
+        """
+        为区域内到达路网边界的起始点(区域内位置positions)规划下载范围更大的新区域
+
+        fetch_distance为实际使用的路网的下载半径(默认为区域的下载半径)，新区域在此基础上扩大factor倍。
+        新区域追加到区域列表末尾，遍历 self.regions 时随后处理；已扩大 MAX_EXPANSIONS 次时返回None。
+        """
+        if region.expansions >= MAX_EXPANSIONS:
+            return None
+        indices = [region.indices[position] for position in positions]
+        expanded = GraphRegion(indices, [self.coordinates[i]['latitude'] for i in indices],
+                               [self.coordinates[i]['longitude'] for i in indices],
+                               max(region.fetch_distance, fetch_distance or 0) * factor, region.expansions + 1)
+        self.regions.append(expanded)
+        return expanded
+
+    def padded(self, region, fetch_distance):
+        """
+        与region包含相同起始点、下载半径扩大到fetch_distance的区域(不加入区域列表)
+
+        用于下载留有余量的路网，之后调大步行距离时仍可复用；fetch_distance不大于区域的下载半径时返回region本身。
+        """
+        if fetch_distance <= region.fetch_distance:
+            return region
+        return GraphRegion(region.indices, [self.coordinates[i]['latitude'] for i in region.indices],
+                           [self.coordinates[i]['longitude'] for i in region.indices],
+                           fetch_distance, region.expansions)
+
+    def load_graph(self, region):
+        """
+        获取区域的紧凑数组路网(CSRGraph)
+
+        优先读取磁盘缓存，未命中时下载、投影并转换后写入缓存。
+        返回 (router, from_cache)。
+        """
+        if self.cache is not None:
+            router = self.cache.get(region.extent, self.network_type)
+            if router is not None:
+                return router, True
+
+        router = CSRGraph(prepare_graph(download_graph(region, self.network_type)))
+        if self.cache is not None:
+            try:
+                self.cache.put(region.extent, self.network_type, router)
+            except OSError:
+                # 缓存写入失败不影响本次计算
+                pass
+        return router, False
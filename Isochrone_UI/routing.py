@@ -0,0 +1,464 @@
+"""
+数组路网与最短路径模块
+
+- 将投影后的NetworkX路网一次性转换为CSR数组(int32索引, float32成本)
+- 只保留计算所需的字段，全部为连续数组：拓扑、边长度、成本列、float32投影坐标(相对路网原点)、
+  紧凑存储的边几何坐标及偏移量；边几何只在需要时为所选的边生成，不保留NetworkX路网与边表
+- 边成本按配置(见cost_profiles)以NumPy列的形式与CSR数组对齐，每种配置每个路网只计算一次，切换配置不修改路网
+- 在数组上运行带距离上限的Dijkstra，替代 nx.ego_graph
+- 可达节点与可达边以NumPy数组/掩码形式返回，无需复制子图
+- 支持一次调用计算多个起始点，结果为稀疏的 起始点×节点 距离矩阵
+- 起始点批量投影，并在节点坐标的KD树(每个路网只建一次)上一次查询最近节点及定位距离
+- 也可在路网边的STRtree上定位最近的边，在投影点处插入虚拟起始点，以沿边到两端节点的长度作为初始距离
+- 定位到同一位置(或相距很近)的起始点归为一组，只计算一次
+- 路网数组可写入目录(每个数组一个.npy文件)，进程池子进程以只读内存映射打开，不反序列化，多个子进程共享同一份路网
+"""
+import os
+import pickle
+
+import numpy as np
+import osmnx as ox
+import shapely
+from pyproj import Transformer
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from cost_profiles import ELEVATION_PROFILES, WALKING_SPEED, edge_costs, profile_key, steps_mask
+
+# scipy的稀疏图会忽略权重为0的边，用一个极小值代替零长度边
+MIN_EDGE_WEIGHT = 1e-3
+
+# 多起始点计算时每批稠密距离矩阵的内存上限(字节)
+MAX_BATCH_BYTES = 256 * 1024 * 1024
+
+# 定位距离超过该值(米)的起始点可能不在路网覆盖范围内
+FAR_SNAP_DISTANCE = 300
+
+# 起始点定位方式: edge(最近的边，虚拟起始点) 或 node(最近的节点)
+SNAP_MODES = ('edge', 'node')
+
+# 虚拟起始点初始距离的取整位数(米)，定位到同一位置的起始点得到相同的起点
+START_COST_DECIMALS = 1
+
+# 共享给子进程的路网数组(当前成本配置)，每个数组写入一个.npy文件
+SHARED_ARRAYS = ('origin', 'node_xy', 'edge_u', 'edge_v', 'edge_lengths', 'edge_steps', 'edge_coords', 'edge_offsets',
+                 'indptr', 'indices', '_csr_order', '_csr_groups', 'edge_costs', 'costs')
+
+# 共享路网目录中保存坐标系、节点数与成本配置键的文件
+SHARED_META = 'meta.pkl'
+
+
+def node_start(node):
+    """从路网节点出发的起点: ((节点下标, 初始距离),)"""
+    return ((int(node), 0.0),)
+
+
+def edge_start(u, cost_u, v, cost_v):
+    """
+    从边上的虚拟起始点出发的起点: ((节点下标, 初始距离), ...)
+
+    步行可沿边向两个方向前进，两端节点分别以沿边的长度作为初始距离；
+    投影点恰好在节点上时等同于从该节点出发。节点按下标排序，正反两个方向的边得到相同的起点。
+    """
+    if cost_u <= 0 or u == v:
+        return node_start(u)
+    if cost_v <= 0:
+        return node_start(v)
+    return tuple(sorted(((int(u), float(cost_u)), (int(v), float(cost_v)))))
+
+
+class CSRGraph:
+    """
+    由投影路网转换得到的紧凑CSR数组路网
+
+    edge_costs/costs/matrix 为当前成本配置(profile)的边成本，with_profile 返回共享数组的其他配置视图。
+    """
+    def __init__(self, G_proj):
+        self.crs = G_proj.graph['crs']
+
+        # 节点：按osmid排序，便于用二分查找定位节点下标(osmid只在转换时使用，不保留)
+        node_ids = np.fromiter(G_proj.nodes, dtype=np.int64, count=len(G_proj))
+        order = np.argsort(node_ids)
+        node_ids = node_ids[order]
+        node_data = list(G_proj.nodes(data=True))
+        x = np.array([node_data[i][1]['x'] for i in order], dtype=np.float64)
+        y = np.array([node_data[i][1]['y'] for i in order], dtype=np.float64)
+        self.n_nodes = len(node_ids)
+
+        # 边：从边表中只取出端点、长度、台阶标记与几何坐标，边表本身不保留
+        edges = ox.graph_to_gdfs(G_proj, nodes=False)
+        u = edges.index.get_level_values(0).to_numpy(dtype=np.int64)
+        v = edges.index.get_level_values(1).to_numpy(dtype=np.int64)
+        self.edge_u = np.searchsorted(node_ids, u).astype(np.int32)
+        self.edge_v = np.searchsorted(node_ids, v).astype(np.int32)
+        self.edge_lengths = edges['length'].to_numpy(dtype=np.float32)  # 与边逐一对应的边长度(米)
+        self.edge_steps = steps_mask(edges)  # 与边逐一对应的台阶掩码
+        coords, index = shapely.get_coordinates(edges.geometry.to_numpy(), return_index=True)
+        del edges
+
+        # 坐标以路网原点为基准存为float32(城市范围内精度优于1厘米)
+        self.origin = np.array([min(x.min(), coords[:, 0].min()), min(y.min(), coords[:, 1].min())]) \
+            if self.n_nodes else np.zeros(2)
+        self.node_xy = (np.column_stack([x, y]) - self.origin).astype(np.float32)
+        self.edge_coords = (coords - self.origin).astype(np.float32)  # 全部边几何的折点，按边顺序连续存放
+        self.edge_offsets = np.zeros(len(self.edge_u) + 1, dtype=np.int64)  # 第i条边的折点为 [offsets[i], offsets[i+1])
+        np.cumsum(np.bincount(index, minlength=len(self.edge_u)), out=self.edge_offsets[1:])
+
+        self._build_csr()
+
+        # 各成本配置的 (边成本, CSR成本, 矩阵)，与各配置视图共享，按需计算
+        self._profiles = {}
+        self._apply_profile('distance', WALKING_SPEED)
+
+        # 节点坐标KD树、边的STRtree与经纬度投影转换器，第一次定位起始点时创建
+        self._tree = None
+        self._edge_tree = None
+        self._transformer = None
+
+    def __getstate__(self):
+        # 保存或传给进程池子进程时只保留数组：不复制空间索引、转换器和其他成本配置，
+        # 当前配置只保存边成本列，CSR成本与矩阵在读取时重建
+        state = self.__dict__.copy()
+        state['_tree'] = None
+        state['_edge_tree'] = None
+        state['_transformer'] = None
+        state['_profiles'] = {}
+        del state['costs'], state['matrix']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._profiles = {self.profile_key: self._profile_arrays(self.edge_costs)}
+        self.edge_costs, self.costs, self.matrix = self._profiles[self.profile_key]
+
+    @property
+    def x(self):
+        """节点投影x坐标(float64)"""
+        return self.node_xy[:, 0] + self.origin[0]
+
+    @property
+    def y(self):
+        """节点投影y坐标(float64)"""
+        return self.node_xy[:, 1] + self.origin[1]
+
+    @property
+    def nbytes(self):
+        """路网数组(拓扑、长度、当前配置成本、坐标与边几何)占用的内存字节数"""
+        arrays = [self.edge_u, self.edge_v, self.edge_lengths, self.edge_steps, self.node_xy, self.edge_coords,
+                  self.edge_offsets, self.indptr, self.indices, self._csr_order, self._csr_groups,
+                  self.edge_costs, self.costs, self.matrix.data]
+        return sum(array.nbytes for array in arrays)
+
+    def save_shared(self, directory):
+        """
+        将路网数组(当前成本配置)写入目录，供进程池子进程以 open_shared 内存映射打开
+
+        CSR矩阵的float64权重也一并写入，打开时无需重新转换。返回目录路径。
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in SHARED_ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        np.save(os.path.join(directory, 'matrix_data.npy'), self.matrix.data)
+        with open(os.path.join(directory, SHARED_META), 'wb') as f:
+            pickle.dump({'crs': self.crs, 'n_nodes': self.n_nodes, 'profile_key': self.profile_key}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        return directory
+
+    @classmethod
+    def open_shared(cls, directory, mmap_mode='r'):
+        """
+        以内存映射打开 save_shared 写入的路网
+
+        数组直接映射文件，不复制也不反序列化，同一台机器上的多个进程共用操作系统页缓存中的同一份路网；
+        默认只读，with_profile 计算的其他配置成本保存在各进程自己的内存中。
+        """
+        with open(os.path.join(directory, SHARED_META), 'rb') as f:
+            state = pickle.load(f)
+        for name in SHARED_ARRAYS:
+            state[name] = np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+        graph = cls.__new__(cls)
+        graph.__dict__.update(state)
+        # csr_matrix直接引用映射的数组(类型一致时不复制)
+        graph.matrix = csr_matrix((np.load(os.path.join(directory, 'matrix_data.npy'), mmap_mode=mmap_mode),
+                                   graph.indices, graph.indptr), shape=(graph.n_nodes, graph.n_nodes))
+        graph._profiles = {graph.profile_key: (graph.edge_costs, graph.costs, graph.matrix)}
+        graph._tree = None
+        graph._edge_tree = None
+        graph._transformer = None
+        return graph
+
+    def edge_coordinates(self, edges=None):
+        """
+        所选边(下标数组或布尔掩码，None为全部边)几何折点的float64投影坐标
+
+        返回 (坐标数组, 每个折点所属的所选边序号数组)。
+        """
+        if edges is None:
+            counts = np.diff(self.edge_offsets)
+            return self.edge_coords + self.origin, np.repeat(np.arange(len(counts)), counts)
+        edges = np.arange(len(self.edge_u))[edges]
+        starts = self.edge_offsets[edges]
+        counts = self.edge_offsets[edges + 1] - starts
+        index = np.repeat(np.arange(len(edges)), counts)
+        # 每个折点在紧凑坐标数组中的位置：所属边的起点 + 在边内的序号
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return self.edge_coords[starts[index] + within] + self.origin, index
+
+    def edge_geometries(self, edges=None):
+        """为所选边(下标数组或布尔掩码，None为全部边)生成shapely LineString数组"""
+        coords, index = self.edge_coordinates(edges)
+        n_edges = len(self.edge_u) if edges is None else len(np.arange(len(self.edge_u))[edges])
+        if not n_edges:
+            return np.empty(0, dtype=object)
+        return shapely.linestrings(coords, indices=index)
+
+    def _build_csr(self):
+        """由边列表构建CSR拓扑(平行边合并为一条)，并记录边表到CSR元素的分组"""
+        order = np.lexsort((self.edge_v, self.edge_u))
+        u, v = self.edge_u[order], self.edge_v[order]
+        first = np.ones(len(u), dtype=bool)
+        first[1:] = (u[1:] != u[:-1]) | (v[1:] != v[:-1])
+        self._csr_order = order.astype(np.int32)  # 按 (u, v) 排序的边下标
+        self._csr_groups = np.flatnonzero(first)  # 每个CSR元素(一组平行边)在排序后边中的起始位置
+
+        self.indptr = np.zeros(self.n_nodes + 1, dtype=np.int32)
+        np.cumsum(np.bincount(u[first], minlength=self.n_nodes), out=self.indptr[1:])
+        self.indices = v[first].astype(np.int32)
+
+    def _profile_arrays(self, costs):
+        """由边成本列生成 (边成本, CSR成本, 矩阵)，平行边取成本最低的一条"""
+        csr_costs = np.maximum(np.minimum.reduceat(costs[self._csr_order], self._csr_groups),
+                               MIN_EDGE_WEIGHT).astype(np.float32) if len(costs) else np.empty(0, dtype=np.float32)
+        # scipy.csgraph内部使用float64权重，预先转换以免每次调用重复复制
+        matrix = csr_matrix((csr_costs.astype(np.float64), self.indices, self.indptr),
+                            shape=(self.n_nodes, self.n_nodes))
+        return costs, csr_costs, matrix
+
+    def _apply_profile(self, profile, walking_speed, dem_path=None):
+        """设置当前成本配置的边成本与CSR矩阵"""
+        key = profile_key(profile, walking_speed, dem_path)
+        if key not in self._profiles:
+            if profile in ELEVATION_PROFILES:
+                from elevation import edge_hiking_costs
+                coords, index = self.edge_coordinates()
+                costs = edge_hiking_costs(coords, index, self.edge_lengths, self.edge_steps, dem_path, self.crs,
+                                          walking_speed)
+            else:
+                costs = edge_costs(self.edge_lengths, self.edge_steps, profile, walking_speed)
+            self._profiles[key] = self._profile_arrays(costs)
+        self.profile_key = key
+        self.edge_costs, self.costs, self.matrix = self._profiles[key]
+
+    def with_profile(self, profile='distance', walking_speed=WALKING_SPEED, dem_path=None):
+        """
+        返回使用指定成本配置的路网视图
+
+        视图与原路网共享节点、边和拓扑数组，不修改原路网；同一配置的成本只计算一次。
+        hills配置需要DEM文件dem_path。
+        """
+        if profile_key(profile, walking_speed, dem_path) == self.profile_key:
+            return self
+        # 直接复制属性字典(copy.copy 会经过 __getstate__，丢弃共享的配置成本与空间索引)
+        view = CSRGraph.__new__(CSRGraph)
+        view.__dict__.update(self.__dict__)
+        view._apply_profile(profile, walking_speed, dem_path)
+        return view
+
+    def project(self, lats, lngs):
+        """将经纬度数组一次性投影到路网坐标系，返回 (x数组, y数组)"""
+        if self._transformer is None:
+            self._transformer = Transformer.from_crs("EPSG:4326", self.crs, always_xy=True)
+        x, y = self._transformer.transform(np.asarray(lngs, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+        return np.asarray(x), np.asarray(y)
+
+    def node_lnglat(self):
+        """全部节点的经纬度，返回 (经度数组, 纬度数组)"""
+        lngs, lats = Transformer.from_crs(self.crs, "EPSG:4326", always_xy=True).transform(self.x, self.y)
+        return np.asarray(lngs), np.asarray(lats)
+
+    def snap_origins(self, lats, lngs):
+        """
+        批量定位起始点最近的路网节点
+
+        返回 (节点下标数组, 定位距离数组(米), 投影x数组, 投影y数组)。
+        """
+        if self._tree is None:
+            self._tree = cKDTree(np.column_stack([self.x, self.y]))
+        x, y = self.project(lats, lngs)
+        snap_dist, nodes = self._tree.query(np.column_stack([x, y]))
+        return nodes.astype(np.int32), snap_dist, x, y
+
+    def snap_to_edges(self, lats, lngs):
+        """
+        批量将起始点投影到最近的路网边上
+
+        返回 (边下标数组, 投影点沿边的比例数组(0~1，自边的起点u起算), 定位距离数组(米), 投影x数组, 投影y数组)。
+        """
+        if self._edge_tree is None:
+            self._edge_tree = shapely.STRtree(self.edge_geometries())
+        x, y = self.project(lats, lngs)
+        points = shapely.points(x, y)
+        (point_index, nearest), distances = self._edge_tree.query_nearest(points, return_distance=True,
+                                                                           all_matches=False)
+        edges = np.empty(len(points), dtype=np.int64)
+        snap_dist = np.empty(len(points), dtype=np.float64)
+        edges[point_index] = nearest
+        snap_dist[point_index] = distances
+        fractions = shapely.line_locate_point(self._edge_tree.geometries[edges], points, normalized=True)
+        return edges, fractions, snap_dist, x, y
+
+    def reverse_edges(self, edges):
+        """
+        所选边(下标数组)的反向边(v->u)下标，没有反向边时为-1
+
+        有多条平行的反向边时取长度与原边最接近的一条(通常为同一条街道的反方向)。
+        """
+        edges = np.asarray(edges, dtype=np.int64)
+        # _csr_order中的边按 (u, v) 排序，二分查找 (v, u) 所在的区间
+        order = self._csr_order
+        keys = self.edge_u[order].astype(np.int64) * self.n_nodes + self.edge_v[order]
+        targets = self.edge_v[edges].astype(np.int64) * self.n_nodes + self.edge_u[edges]
+        lo = np.searchsorted(keys, targets, side='left')
+        hi = np.searchsorted(keys, targets, side='right')
+        reverse = np.where(hi > lo, order[np.minimum(lo, len(order) - 1)], -1).astype(np.int64)
+        for i in np.flatnonzero(hi - lo > 1):
+            candidates = order[lo[i]:hi[i]]
+            reverse[i] = candidates[np.argmin(np.abs(self.edge_lengths[candidates] - self.edge_lengths[edges[i]]))]
+        return reverse
+
+    def locate_origins(self, lats, lngs, snap='edge'):
+        """
+        批量定位起始点
+
+        snap为 'node' 时从最近的节点出发；为 'edge' 时在最近的边上插入虚拟起始点，
+        以沿边到两端节点的成本(按各自的行走方向)作为初始距离。返回 (起点列表, 定位距离数组, 投影x数组, 投影y数组)，
+        起点的格式见 node_start / edge_start。
+        """
+        if snap == 'node':
+            nodes, snap_dist, x, y = self.snap_origins(lats, lngs)
+            return [node_start(node) for node in nodes], snap_dist, x, y
+        if snap != 'edge':
+            raise ValueError(f"Unknown snap mode: {snap}")
+        edges, fractions, snap_dist, x, y = self.snap_to_edges(lats, lngs)
+        # 成本可能与方向有关(hills配置)：走向v按u->v边的成本，走回u按反向边v->u的成本，没有反向边时按u->v边计算
+        forward = self.edge_costs[edges]
+        reverse = self.reverse_edges(edges)
+        backward = np.where(reverse >= 0, self.edge_costs[np.maximum(reverse, 0)], forward)
+        cost_u = np.round(fractions * backward, START_COST_DECIMALS)
+        cost_v = np.round((1 - fractions) * forward, START_COST_DECIMALS)
+        starts = [edge_start(*seed) for seed in zip(self.edge_u[edges].tolist(), cost_u.tolist(),
+                                                    self.edge_v[edges].tolist(), cost_v.tolist())]
+        return starts, snap_dist, x, y
+
+    def shortest_distances(self, origin, cutoff):
+        """
+        计算从起始节点(数组下标)出发、距离不超过cutoff的可达节点
+
+        返回 (可达节点下标数组, 对应最短距离数组)
+        """
+        dist = dijkstra(self.matrix, directed=True, indices=int(origin), limit=cutoff)
+        reach = np.flatnonzero(np.isfinite(dist)).astype(np.int32)
+        return reach, dist[reach].astype(np.float32)
+
+    def seeded_matrix(self, starts):
+        """
+        为起点列表构建用于Dijkstra的矩阵及各起点的行下标
+
+        从单个节点出发的起点直接使用该节点；其余起点各追加一个虚拟节点(只有出边)，
+        出边指向起点的各个节点、权重为初始距离，Dijkstra从虚拟节点出发即等同于以初始距离为种子。
+        返回 (CSR矩阵, 行下标数组)。
+        """
+        direct = np.array([start[0][0] if len(start) == 1 and start[0][1] == 0 else -1 for start in starts],
+                          dtype=np.int64)
+        virtual = np.flatnonzero(direct < 0)
+        if not len(virtual):
+            return self.matrix, direct
+        seeds = [starts[i] for i in virtual]
+        counts = np.array([len(seed) for seed in seeds], dtype=np.int64)
+        seed_nodes = np.array([node for seed in seeds for node, _ in seed], dtype=np.int32)
+        seed_costs = np.maximum(np.array([cost for seed in seeds for _, cost in seed], dtype=np.float64),
+                                MIN_EDGE_WEIGHT)
+        size = self.n_nodes + len(virtual)
+        indptr = np.concatenate([self.matrix.indptr.astype(np.int64), self.matrix.indptr[-1] + np.cumsum(counts)])
+        matrix = csr_matrix((np.concatenate([self.matrix.data, seed_costs]),
+                             np.concatenate([self.matrix.indices, seed_nodes]), indptr), shape=(size, size))
+        rows = direct.copy()
+        rows[virtual] = self.n_nodes + np.arange(len(virtual))
+        return matrix, rows
+
+    def multi_source_distances(self, starts, cutoff, max_batch_bytes=MAX_BATCH_BYTES):
+        """
+        一次计算多个起点在cutoff距离内到各节点的最短距离
+
+        starts为起点列表(见 node_start / edge_start)。返回稀疏矩阵(行: 起点, 列: 节点, 值: float32距离)，
+        从节点出发时该节点自身的0距离作为显式元素保留。
+        """
+        starts = list(starts)
+        matrix, origins = self.seeded_matrix(starts)
+        batch = max(1, int(max_batch_bytes // (8 * max(matrix.shape[0], 1))))
+        row_counts, cols, data = [], [], []
+        for start in range(0, len(origins), batch):
+            dist = dijkstra(matrix, directed=True, indices=origins[start:start + batch], limit=cutoff)
+            dist = dist[:, :self.n_nodes]
+            finite = np.isfinite(dist)
+            rows, c = np.nonzero(finite)
+            row_counts.append(finite.sum(axis=1))
+            cols.append(c.astype(np.int32))
+            data.append(dist[rows, c].astype(np.float32))
+
+        indptr = np.zeros(len(origins) + 1, dtype=np.int64)
+        if len(origins):
+            np.cumsum(np.concatenate(row_counts), out=indptr[1:])
+        indices = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int32)
+        values = np.concatenate(data) if data else np.zeros(0, dtype=np.float32)
+        return csr_matrix((values, indices, indptr), shape=(len(origins), self.n_nodes))
+
+    @staticmethod
+    def row_distances(distances, row):
+        """从多起始点距离矩阵中取出第row个起始点的 (可达节点下标, 距离)"""
+        start, end = distances.indptr[row], distances.indptr[row + 1]
+        return distances.indices[start:end], distances.data[start:end]
+
+    def reachable_edge_mask(self, reach):
+        """两端节点均可达的边的布尔掩码(与 nx.ego_graph 的诱导子图一致)"""
+        mask = np.zeros(self.n_nodes, dtype=bool)
+        mask[reach] = True
+        return mask[self.edge_u] & mask[self.edge_v]
+
+    def reachable_edge_geometries(self, reach):
+        """两端节点均可达的边的几何数组"""
+        return self.edge_geometries(self.reachable_edge_mask(reach))
+
+
+def group_origins(starts, x, y, tolerance=0):
+    """
+    将起点相同(定位到同一节点或边上同一位置)的起始点归为一组，tolerance(米)大于0时与组代表点相距不超过tolerance的起始点也归入该组
+
+    starts为各起始点的起点，x/y为其投影坐标。按先后顺序，尚未分组的第一个点成为新组的代表点，
+    其起点用于整组的最短路径计算；不会经由中间点逐个串连，组内每个点与代表点的距离都在tolerance以内(或起点相同)。
+    返回组列表，每组为起始点位置的数组，按代表点(组内第一个点)的先后排序。
+    """
+    if not len(starts):
+        return []
+    first = {}
+    labels = np.array([first.setdefault(start, len(first)) for start in starts])
+    order = np.argsort(labels, kind='stable')
+    same_start = np.split(order, np.flatnonzero(np.diff(labels[order])) + 1)
+    if tolerance <= 0 or len(starts) < 2:
+        return sorted(same_start, key=lambda group: group[0])
+
+    # 每个点tolerance范围内的点一次查询，之后按代表点贪心分组
+    xy = np.column_stack([x, y])
+    neighbours = cKDTree(xy).query_ball_point(xy, r=tolerance)
+    assigned = np.zeros(len(starts), dtype=bool)
+    groups = []
+    for position in range(len(starts)):
+        if assigned[position]:
+            continue
+        # 排在代表点之前的点均已分组，组内点按位置排序后代表点在第一位
+        candidates = np.union1d(same_start[labels[position]], neighbours[position])
+        group = candidates[~assigned[candidates]]
+        assigned[group] = True
+        groups.append(group)
+    return groups
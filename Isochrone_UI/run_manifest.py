@@ -0,0 +1,86 @@
+"""
+批量任务断点续跑模块
+
+- 输出目录中的 manifest.jsonl 逐行记录已完成的点及其输入哈希
+- 输入哈希由坐标、名称、步行距离、多边形与绘图参数、路网版本组成
+- 重新运行同一任务时跳过哈希一致且输出文件仍存在的点，只计算新增或参数改变的点
+- 逐行追加写入，任务中途中断时已完成的记录不会丢失
+"""
+import hashlib
+import json
+import os
+
+from graph_cache import current_snapshot
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+def point_key(name, lat, lng):
+    """点的标识：名称与坐标"""
+    return f'{name}|{float(lat):.7f}|{float(lng):.7f}'
+
+
+def graph_version(network_type='all', snapshot=None):
+    """路网版本：路网类型与OSM数据快照"""
+    return f'{network_type}|{snapshot or current_snapshot()}'
+
+
+class RunManifest:
+    """输出目录中的已完成点记录"""
+    def __init__(self, output_dir, settings, graph_version):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        # 与具体点无关的任务参数，参与每个点的输入哈希
+        self.job = json.dumps({'settings': settings.fingerprint(), 'graph': graph_version}, sort_keys=True)
+        self.entries = self._load()
+
+    def _load(self):
+        entries = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 中断时可能留下不完整的最后一行
+                        continue
+                    entries[entry['key']] = entry
+        except OSError:
+            pass
+        return entries
+
+    def input_hash(self, point):
+        """点的输入哈希"""
+        text = '|'.join([self.job, point_key(point['name'], point['latitude'], point['longitude'])])
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def is_done(self, point):
+        """该点是否已用相同输入完成，且输出地图仍存在"""
+        entry = self.entries.get(point_key(point['name'], point['latitude'], point['longitude']))
+        return (entry is not None and entry['hash'] == self.input_hash(point)
+                and os.path.exists(os.path.join(self.output_dir, entry['png'])))
+
+    def record(self, point, png_path):
+        """记录一个已完成的点(立即追加写入文件)"""
+        entry = {
+            'key': point_key(point['name'], point['latitude'], point['longitude']),
+            'hash': self.input_hash(point),
+            'png': os.path.relpath(png_path, self.output_dir),
+        }
+        self.entries[entry['key']] = entry
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def pending_points(points, manifest, sink=None):
+    """
+    筛选需要计算的点
+
+    已用相同输入完成的点被跳过；若输出批量矢量图层，已完成的点还必须能在已有图层中找到，
+    并由sink保留到新文件中。返回 (待计算点的下标列表, 跳过的点数)。
+    """
+    done = {point_key(p['name'], p['latitude'], p['longitude']) for p in points if manifest.is_done(p)}
+    if sink is not None:
+        done = sink.keep_existing(done)
+    todo = [i for i, p in enumerate(points) if point_key(p['name'], p['latitude'], p['longitude']) not in done]
+    return todo, len(points) - len(todo)
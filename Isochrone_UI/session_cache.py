@@ -0,0 +1,181 @@
+"""
+会话内计算结果缓存模块
+
+- 图形界面的一次会话中保留最近使用的区域路网(CSR数组)及起始点的定位结果(起点)
+- 区域路网按覆盖范围查找：范围完整覆盖所需范围的路网即可复用，步行距离改变、所需范围随之改变时不必重新下载
+- 每个起始点的最短距离数组(可达节点下标及距离)保存在内存LRU缓存中，超出内存预算时转存到临时目录
+- 最短距离按 步行距离 x (1 + SEARCH_MARGIN) 的搜索半径计算，缓存的搜索半径覆盖新的步行距离时，
+  只需重新构建等时圈多边形并绘图，无需重新下载路网或计算最短路径
+"""
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+# 默认的内存预算(MB)
+DEFAULT_MEMORY_MB = 256
+
+# 最短距离搜索半径相对最大步行距离的余量，之后调大步行距离时可直接复用
+SEARCH_MARGIN = 0.2
+
+# 会话内保留的区域路网个数
+REGION_SLOTS = 1
+
+
+def search_radius(distance, margin=SEARCH_MARGIN):
+    """最短距离计算的搜索半径"""
+    return distance * (1 + margin)
+
+
+class DistanceCache:
+    """起始点最短距离数组的LRU缓存，超出内存预算的条目转存到磁盘"""
+    def __init__(self, memory_mb=DEFAULT_MEMORY_MB, spill_dir=None):
+        self.max_bytes = int(memory_mb * 1024 * 1024)
+        self.spill_dir = spill_dir  # 为None时在第一次转存时创建临时目录
+        self._own_spill_dir = spill_dir is None
+        self._memory = OrderedDict()  # {键: (搜索半径, 可达节点下标, 距离)}，按使用时间排序
+        self._spilled = {}  # {键: (搜索半径, 文件路径)}
+        self.nbytes = 0
+        self._spill_count = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, distance):
+        """
+        取出在distance范围内的 (可达节点下标, 距离)
+
+        未缓存或缓存的搜索半径小于distance时返回None。
+        """
+        if key in self._memory:
+            radius, reach, reach_dist = self._memory[key]
+            self._memory.move_to_end(key)
+        elif key in self._spilled:
+            radius, path = self._spilled[key]
+            if radius < distance:
+                self.misses += 1
+                return None
+            # 从磁盘读回内存
+            del self._spilled[key]
+            with np.load(path) as data:
+                reach, reach_dist = data['reach'], data['dist']
+            os.remove(path)
+            self._store(key, radius, reach, reach_dist)
+        else:
+            self.misses += 1
+            return None
+        if radius < distance:
+            self.misses += 1
+            return None
+        self.hits += 1
+        keep = reach_dist <= distance
+        return reach[keep], reach_dist[keep]
+
+    def put(self, key, radius, reach, reach_dist):
+        """保存一个起始点在搜索半径radius内的最短距离"""
+        if key in self._memory:
+            self.nbytes -= self._entry_bytes(self._memory.pop(key))
+        spilled = self._spilled.pop(key, None)
+        if spilled is not None:
+            os.remove(spilled[1])
+        self._store(key, radius, np.asarray(reach, dtype=np.int32), np.asarray(reach_dist, dtype=np.float32))
+
+    def _store(self, key, radius, reach, reach_dist):
+        entry = (radius, reach, reach_dist)
+        self._memory[key] = entry
+        self.nbytes += self._entry_bytes(entry)
+        # 超出内存预算时将最久未使用的条目写入磁盘
+        while self.nbytes > self.max_bytes and len(self._memory) > 1:
+            old_key, old_entry = self._memory.popitem(last=False)
+            self.nbytes -= self._entry_bytes(old_entry)
+            self._spill(old_key, old_entry)
+
+    @staticmethod
+    def _entry_bytes(entry):
+        return entry[1].nbytes + entry[2].nbytes
+
+    def _spill(self, key, entry):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='isochrone_distances_')
+        radius, reach, reach_dist = entry
+        self._spill_count += 1
+        path = os.path.join(self.spill_dir, f'{self._spill_count}.npz')
+        np.savez(path, reach=reach, dist=reach_dist)
+        self._spilled[key] = (radius, path)
+
+    def __len__(self):
+        return len(self._memory) + len(self._spilled)
+
+    def clear(self):
+        """清空缓存并删除转存文件"""
+        self._memory.clear()
+        self.nbytes = 0
+        for _, path in self._spilled.values():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._spilled.clear()
+
+    def close(self):
+        self.clear()
+        if self._own_spill_dir and self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+
+
+class SessionCache:
+    """一次图形界面会话内保留的区域路网、起始点节点与最短距离"""
+    def __init__(self, memory_mb=DEFAULT_MEMORY_MB, region_slots=REGION_SLOTS):
+        self.region_slots = region_slots
+        self.regions = OrderedDict()  # {区域键: (路网所在区域GraphRegion, CSRGraph)}
+        self.origins = {}  # {(路网键, 定位方式, 纬度, 经度): (起点, 定位距离, 投影x, 投影y)}
+        self.distances = DistanceCache(memory_mb)
+
+    @staticmethod
+    def region_key(extent, network_type, snapshot):
+        """由区域范围、路网类型和数据快照组成的区域键"""
+        return '|'.join([network_type, snapshot] + [f'{b:.5f}' for b in extent])
+
+    def find_region(self, extent, network_type, snapshot):
+        """
+        查找会话中保留的、范围完整覆盖extent(west, south, east, north)的区域CSR路网
+
+        与 GraphCache.find 一样优先使用最小的覆盖路网。返回 (区域键, 路网所在区域, CSRGraph)，没有时返回 (None, None, None)；
+        区域键只由保留的路网决定，之后的最短距离与起点缓存随路网一起复用。
+        """
+        west, south, east, north = extent
+        prefix = f'{network_type}|{snapshot}|'
+        candidates = []
+        for key, (region, _) in self.regions.items():
+            w, s, e, n = region.extent
+            if key.startswith(prefix) and w <= west and s <= south and e >= east and n >= north:
+                candidates.append(((e - w) * (n - s), key))
+        if not candidates:
+            return None, None, None
+        key = min(candidates)[1]
+        self.regions.move_to_end(key)
+        region, router = self.regions[key]
+        return key, region, router
+
+    def put_region(self, region, network_type, snapshot, router):
+        """保留区域路网(region为路网的下载区域)，返回其区域键"""
+        key = self.region_key(region.extent, network_type, snapshot)
+        self.regions[key] = (region, router)
+        self.regions.move_to_end(key)
+        while len(self.regions) > self.region_slots:
+            old_key, _ = self.regions.popitem(last=False)
+            # 被淘汰区域的起点不再有效
+            self.origins = {k: v for k, v in self.origins.items() if not k[0].startswith(old_key + '|')}
+        return key
+
+    @staticmethod
+    def graph_key(region_key, router):
+        """最短距离缓存中区分路网的键，路网内容不同(节点或边数不同)或成本配置不同时不会误用旧结果"""
+        return f'{region_key}|{router.n_nodes}|{len(router.edge_u)}|{router.profile_key}'
+
+    def close(self):
+        self.regions.clear()
+        self.origins.clear()
+        self.distances.close()
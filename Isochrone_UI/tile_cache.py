@@ -0,0 +1,258 @@
+"""
+底图瓦片本地缓存模块
+
+- 瓦片按 提供商/z/x/y 保存在磁盘上，绘图时优先读取本地瓦片
+- 相邻起始点的视图大多共用同一批瓦片，只需下载一次
+- 离线模式下只使用本地瓦片，缺失的瓦片留空
+- 可预先下载某个经纬度范围内的瓦片(见文件末尾的命令行入口)
+- 批量模式可将所有起始点视图所需的瓦片拼成一张整体底图(BasemapMosaic)，
+  每个点只取其中的一块切片，不再逐点拼接瓦片
+
+瓦片源可以是 xyzservices 的 TileProvider，也可以是带 {z}/{x}/{y} 占位符的URL，
+例如本地HTTP服务 http://127.0.0.1:8000/{z}/{x}/{y}.png
+"""
+import argparse
+import hashlib
+import io
+import os
+import re
+import threading
+
+import contextily as cx
+import mercantile as mt
+import numpy as np
+import requests
+from PIL import Image
+from xyzservices import TileProvider
+
+# 默认瓦片缓存目录、瓦片源与缩放级别
+DEFAULT_TILE_DIR = os.path.join(os.path.expanduser('~'), '.isochrone_cache', 'tiles')
+DEFAULT_PROVIDER = cx.providers.OpenStreetMap.Mapnik
+DEFAULT_ZOOM = 16
+
+# 下载单个瓦片的超时时间(秒)
+TILE_TIMEOUT = 30
+
+
+def resolve_provider(source):
+    """将URL字符串或TileProvider统一为TileProvider"""
+    if source is None:
+        return DEFAULT_PROVIDER
+    if isinstance(source, str):
+        # 自定义URL以其哈希作为缓存目录名，避免不同URL的瓦片混在一起
+        name = 'url-' + hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+        return TileProvider(url=source, attribution='', name=name)
+    return source
+
+
+class TileCache:
+    """按 提供商/z/x/y 组织的磁盘瓦片缓存"""
+    def __init__(self, cache_dir=DEFAULT_TILE_DIR, source=None, offline=False):
+        self.cache_dir = cache_dir
+        self.provider = resolve_provider(source)
+        self.offline = offline
+        self.hits = 0
+        self.downloads = 0
+        self.missing = 0
+        # 提供商名称作为子目录，去掉不适合作为路径的字符
+        self.provider_key = re.sub(r'[^A-Za-z0-9_.-]+', '_', self.provider.name)
+
+    def tile_path(self, z, x, y):
+        return os.path.join(self.cache_dir, self.provider_key, str(z), str(x), f'{y}.png')
+
+    def tile_bytes(self, z, x, y):
+        """读取瓦片的原始字节，本地没有时下载并保存；离线模式下缺失返回None"""
+        path = self.tile_path(z, x, y)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            self.hits += 1
+            return data
+        except OSError:
+            pass
+        if self.offline:
+            self.missing += 1
+            return None
+
+        response = requests.get(self.provider.build_url(x=x, y=y, z=z),
+                                headers={'user-agent': cx.tile.USER_AGENT}, timeout=TILE_TIMEOUT)
+        response.raise_for_status()
+        data = response.content
+        # 原子写入，多个线程/进程同时下载同一瓦片时不会读到半个文件
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.downloads += 1
+        return data
+
+    def tile_array(self, tile):
+        """读取瓦片为RGBA数组，缺失时返回None"""
+        data = self.tile_bytes(tile.z, tile.x, tile.y)
+        if data is None:
+            return None
+        with Image.open(io.BytesIO(data)) as image:
+            return np.asarray(image.convert('RGBA'))
+
+    def bounds2img(self, west, south, east, north, zoom=DEFAULT_ZOOM):
+        """
+        拼接覆盖Web Mercator范围的瓦片
+
+        返回 (RGBA图像数组, Web Mercator范围 (left, right, bottom, top))，
+        与 cx.bounds2img 的返回值一致。离线缺失的瓦片保持透明。
+        """
+        w, s = mt.lnglat(west, south)
+        e, n = mt.lnglat(east, north)
+        tiles = list(mt.tiles(w, s, e, n, [zoom]))
+        arrays = [self.tile_array(tile) for tile in tiles]
+
+        xs = np.array([tile.x for tile in tiles])
+        ys = np.array([tile.y for tile in tiles])
+        size = next((a.shape[0] for a in arrays if a is not None), 256)
+        img = np.zeros(((ys.max() - ys.min() + 1) * size, (xs.max() - xs.min() + 1) * size, 4), dtype=np.uint8)
+        for tile, array in zip(tiles, arrays):
+            if array is not None:
+                row, col = (tile.y - ys.min()) * size, (tile.x - xs.min()) * size
+                img[row:row + size, col:col + size] = array
+
+        # 左上角与右下角瓦片的Web Mercator范围
+        upper_left = mt.xy_bounds(mt.Tile(xs.min(), ys.min(), zoom))
+        lower_right = mt.xy_bounds(mt.Tile(xs.max(), ys.max(), zoom))
+        return img, (upper_left.left, lower_right.right, lower_right.bottom, upper_left.top)
+
+    @property
+    def attribution(self):
+        return self.provider.get('attribution', '')
+
+    def basemap_image(self, xmin, xmax, ymin, ymax, zoom=DEFAULT_ZOOM):
+        """覆盖地图视图(Web Mercator范围)的底图图像及其范围，替代 cx.add_basemap 的取图部分"""
+        return self.bounds2img(xmin, ymin, xmax, ymax, zoom)
+
+    def prewarm(self, west, south, east, north, zoom=DEFAULT_ZOOM, progress=None):
+        """
+        预先下载经纬度范围内的全部瓦片，已缓存的瓦片跳过
+
+        返回 (瓦片总数, 新下载数)
+        """
+        tiles = list(mt.tiles(west, south, east, north, [zoom]))
+        downloads = self.downloads
+        for number, tile in enumerate(tiles, 1):
+            self.tile_bytes(tile.z, tile.x, tile.y)
+            if progress is not None:
+                progress(number, len(tiles))
+        return len(tiles), self.downloads - downloads
+
+
+class BasemapMosaic:
+    """
+    覆盖一批起始点视图的整体底图
+
+    底图以.npy文件保存并以内存映射方式读取，每个点的视图是其中的一块切片(不复制数据)；
+    多个进程打开同一文件时共享操作系统的页缓存。
+    """
+    def __init__(self, path, left, top, resolution, attribution=''):
+        self.path = path
+        self.left = left              # 整体底图左上角的Web Mercator坐标
+        self.top = top
+        self.resolution = resolution  # 每个像素的Web Mercator长度
+        self.attribution = attribution
+        self._image = None
+
+    @classmethod
+    def build(cls, tile_cache, lats, lngs, half_width, path, zoom=DEFAULT_ZOOM, progress=None):
+        """
+        拼接所有起始点视图(以起始点为中心、半宽half_width的Web Mercator正方形)所需的瓦片
+
+        只下载视图覆盖的瓦片，包络内其余部分保持透明。
+        """
+        tiles = set()
+        for lat, lng in zip(lats, lngs):
+            x, y = mt.xy(lng, lat)
+            w, s = mt.lnglat(x - half_width, y - half_width)
+            e, n = mt.lnglat(x + half_width, y + half_width)
+            tiles.update(mt.tiles(w, s, e, n, [zoom]))
+        tiles = sorted(tiles, key=lambda t: (t.y, t.x))
+        x0 = min(t.x for t in tiles)
+        y0 = min(t.y for t in tiles)
+        n_x = max(t.x for t in tiles) - x0 + 1
+        n_y = max(t.y for t in tiles) - y0 + 1
+
+        # 逐个瓦片写入磁盘上的数组，整体底图不需要完整放入内存
+        image = None
+        for number, tile in enumerate(tiles, 1):
+            array = tile_cache.tile_array(tile)
+            if array is not None:
+                size = array.shape[0]
+                if image is None:
+                    image = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8,
+                                                      shape=(n_y * size, n_x * size, 4))
+                row, col = (tile.y - y0) * size, (tile.x - x0) * size
+                image[row:row + size, col:col + size] = array
+            if progress is not None:
+                progress(number, len(tiles))
+        if image is None:
+            # 离线且没有任何本地瓦片时，生成全透明底图
+            size = 256
+            image = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(n_y * size, n_x * size, 4))
+        image.flush()
+        del image
+
+        upper_left = mt.xy_bounds(mt.Tile(x0, y0, zoom))
+        resolution = (upper_left.right - upper_left.left) / size
+        return cls(path, upper_left.left, upper_left.top, resolution, tile_cache.attribution)
+
+    def __getstate__(self):
+        # 进程间只传递文件路径和地理参照，子进程自行打开内存映射
+        state = self.__dict__.copy()
+        state['_image'] = None
+        return state
+
+    @property
+    def image(self):
+        if self._image is None:
+            self._image = np.load(self.path, mmap_mode='r')
+        return self._image
+
+    def crop(self, xmin, xmax, ymin, ymax):
+        """
+        取出覆盖Web Mercator范围的切片
+
+        返回 (图像切片, Web Mercator范围 (left, right, bottom, top))
+        """
+        height, width = self.image.shape[:2]
+        col0 = max(int(np.floor((xmin - self.left) / self.resolution)), 0)
+        col1 = min(int(np.ceil((xmax - self.left) / self.resolution)), width)
+        row0 = max(int(np.floor((self.top - ymax) / self.resolution)), 0)
+        row1 = min(int(np.ceil((self.top - ymin) / self.resolution)), height)
+        extent = (self.left + col0 * self.resolution, self.left + col1 * self.resolution,
+                  self.top - row1 * self.resolution, self.top - row0 * self.resolution)
+        return self.image[row0:row1, col0:col1], extent
+
+    def basemap_image(self, xmin, xmax, ymin, ymax, zoom=DEFAULT_ZOOM):
+        """地图视图的底图切片，与 TileCache.basemap_image 用法相同(整体底图的缩放级别在拼接时已确定)"""
+        return self.crop(xmin, xmax, ymin, ymax)
+
+
+def parse_args():
+    """命令行参数"""
+    parser = argparse.ArgumentParser(description="预先下载底图瓦片到本地缓存")
+    parser.add_argument('--bbox', type=float, nargs=4, required=True, metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'),
+                        help="经纬度范围")
+    parser.add_argument('--zoom', type=int, default=DEFAULT_ZOOM, help="缩放级别(默认16，与等时圈地图一致)")
+    parser.add_argument('--tile-dir', default=DEFAULT_TILE_DIR, help="瓦片缓存目录")
+    parser.add_argument('--tile-url', default=None,
+                        help="瓦片URL模板，如 http://127.0.0.1:8000/{z}/{x}/{y}.png (默认OpenStreetMap)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    cache = TileCache(args.tile_dir, args.tile_url)
+    total, downloaded = cache.prewarm(*args.bbox, zoom=args.zoom,
+                                      progress=lambda n, total: print(f"\r{n}/{total}", end=''))
+    print(f"\n共 {total} 个瓦片，新下载 {downloaded} 个，保存在 {os.path.join(cache.cache_dir, cache.provider_key)}")
+
+
+if __name__ == '__main__':
+    main()
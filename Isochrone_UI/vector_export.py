@@ -0,0 +1,120 @@
+"""
+等时圈批量矢量输出模块
+
+- 全部起始点的等时圈写入同一个 GeoPackage 或 GeoParquet 图层(字段: name, lat, lng, distance)
+- 结果先在内存中缓冲，达到一定行数后批量追加写入，避免逐点创建文件
+- GeoParquet 需要 pyarrow，每次批量写入为一个行组
+"""
+import json
+import os
+
+import geopandas as gpd
+import pandas as pd
+
+from run_manifest import point_key
+
+# 可选的批量输出格式及文件扩展名
+VECTOR_FORMATS = {'gpkg': '.gpkg', 'parquet': '.parquet'}
+
+# 默认图层名与缓冲行数
+DEFAULT_LAYER = 'isochrones'
+DEFAULT_BUFFER_ROWS = 200
+
+
+class BatchVectorSink:
+    """将逐点的等时圈(WGS84 GeoDataFrame)缓冲后批量写入单个图层"""
+    def __init__(self, path, vector_format='gpkg', layer=DEFAULT_LAYER, buffer_rows=DEFAULT_BUFFER_ROWS):
+        if vector_format not in VECTOR_FORMATS:
+            raise ValueError(f"Unknown vector format: {vector_format}")
+        self.path = path
+        self.vector_format = vector_format
+        self.layer = layer
+        self.buffer_rows = buffer_rows
+        self.rows_written = 0
+        self._buffer = []
+        self._buffered_rows = 0
+        self._parquet_writer = None
+
+    def keep_existing(self, keys):
+        """
+        断点续跑时保留已有文件中属于已完成点的行
+
+        keys为 point_key(name, lat, lng) 的集合；必须在第一次写入(覆盖旧文件)之前调用。
+        返回实际在文件中找到并保留的点标识集合，文件不存在或无法读取(如中断时未写完)时为空。
+        """
+        if not keys or not os.path.exists(self.path):
+            return set()
+        try:
+            if self.vector_format == 'gpkg':
+                existing = gpd.read_file(self.path, layer=self.layer)
+            else:
+                existing = gpd.read_parquet(self.path)
+        except Exception:
+            return set()
+        row_keys = [point_key(*row) for row in zip(existing['name'], existing['lat'], existing['lng'])]
+        keep = [key in keys for key in row_keys]
+        if any(keep):
+            self.add(existing[keep])
+        return {key for key, k in zip(row_keys, keep) if k}
+
+    def add(self, isochrone_gdf):
+        """添加一个点的等时圈(每个步行距离一行)，缓冲满时批量写入"""
+        self._buffer.append(isochrone_gdf)
+        self._buffered_rows += len(isochrone_gdf)
+        if self._buffered_rows >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        """将缓冲的等时圈写入文件"""
+        if not self._buffer:
+            return
+        batch = pd.concat(self._buffer, ignore_index=True)
+        if self.vector_format == 'gpkg':
+            self._write_gpkg(batch)
+        else:
+            self._write_parquet(batch)
+        self.rows_written += len(batch)
+        self._buffer = []
+        self._buffered_rows = 0
+
+    def _write_gpkg(self, batch):
+        # 第一次写入时覆盖旧文件，之后追加到同一图层
+        mode = 'a' if self.rows_written else 'w'
+        batch.to_file(self.path, layer=self.layer, driver='GPKG', mode=mode)
+
+    def _write_parquet(self, batch):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("GeoParquet export requires pyarrow: pip install pyarrow")
+
+        columns = {name: batch[name].to_numpy() for name in batch.columns if name != batch.geometry.name}
+        columns['geometry'] = batch.geometry.to_wkb().to_numpy()
+        table = pa.table(columns)
+        if self._parquet_writer is None:
+            # 按GeoParquet规范在文件元数据中声明WKB几何列及坐标系
+            geo = {
+                'version': '1.0.0',
+                'primary_column': 'geometry',
+                'columns': {'geometry': {
+                    'encoding': 'WKB',
+                    'geometry_types': ['Polygon'],
+                    'crs': batch.crs.to_json_dict() if batch.crs is not None else None,
+                }},
+            }
+            schema = table.schema.with_metadata({b'geo': json.dumps(geo).encode('utf-8')})
+            self._parquet_writer = pq.ParquetWriter(self.path, schema)
+        self._parquet_writer.write_table(table.cast(self._parquet_writer.schema))
+
+    def close(self):
+        """写入剩余的缓冲并关闭文件"""
+        self.flush()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+
+def batch_vector_path(output_dir, distance_label, vector_format):
+    """批量矢量文件路径，如 isochrones_500-1000m.gpkg"""
+    return os.path.join(output_dir, f'isochrones_{distance_label}m{VECTOR_FORMATS[vector_format]}')